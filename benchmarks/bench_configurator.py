@@ -0,0 +1,79 @@
+"""Benchmark startup cost of merging a large yaml config and command line
+overrides.
+
+Usage (with chino installed): python benchmarks/bench_configurator.py --sections 100 --keys 100
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import yaml
+
+import chino.configurator as cc
+from chino.frozen_dict import FrozenDict
+
+
+def make_cfg(sections, keys):
+    lcfg = FrozenDict()
+    for i in range(sections):
+        for j in range(keys):
+            lcfg['SECTION{}'.format(i)]['KEY{}'.format(j)] = float(j)
+    lcfg.freeze()
+    return lcfg
+
+
+def bench(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sections', type=int, default=100)
+    parser.add_argument('--keys', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    folder = tempfile.mkdtemp()
+    try:
+        yml = os.path.join(folder, 'cfg.yml')
+        with open(yml, 'w') as f:
+            yaml.dump({'SECTION{}'.format(i): {'KEY{}'.format(j): j + 1 for j in range(args.keys)}
+                       for i in range(args.sections)}, f)
+        cache_dir = os.path.join(folder, 'cache')
+        lcfg = make_cfg(args.sections, args.keys)
+
+        def _pure_python():
+            with open(yml, 'r') as f:
+                cc._merge_dict_into_Dict(yaml.load(f, Loader=yaml.FullLoader), lcfg)
+
+        pure = bench(_pure_python, args.repeat)
+        first = bench(lambda: (cc._PARSED_YML.clear(), cc.merge_from_yml(yml, lcfg)), args.repeat)
+        uncached = bench(lambda: cc.merge_from_yml(yml, lcfg), args.repeat)
+        cc.merge_from_yml(yml, lcfg, cache=cache_dir)  # warm up
+        cached = bench(lambda: cc.merge_from_yml(yml, lcfg, cache=cache_dir), args.repeat)
+        argv = ['SECTION0.KEY0=2', '--SECTION1.KEY1', '3']
+
+        def _argparse():
+            cc.merge_from_parser_args(cc.cfg_parser(lcfg).parse_args(argv[1:]), lcfg)
+
+        full_parser = bench(_argparse, args.repeat)
+        overrides = bench(lambda: cc.merge_from_argv(argv, lcfg), args.repeat)
+    finally:
+        shutil.rmtree(folder)
+    print('keys: {0}'.format(args.sections * args.keys))
+    print('pure python loader:   {:.3f}s'.format(pure))
+    print('merge_from_yml:       {:.3f}s'.format(first))
+    print('  with parsed files:  {:.3f}s'.format(uncached))
+    print('  with cache dir:     {:.3f}s'.format(cached))
+    print('cfg_parser override:  {:.3f}s'.format(full_parser))
+    print('merge_from_argv:      {:.3f}ms'.format(overrides * 1e3))
+
+
+if __name__ == '__main__':
+    main()
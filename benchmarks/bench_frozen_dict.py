@@ -0,0 +1,149 @@
+"""Micro-benchmarks of FrozenDict attribute access, flattening and building
+configs from flat keys.
+
+Compares against the previous addict based implementation (if addict is
+installed) and plain attribute access as the lower bound.
+
+Usage (with chino installed): python benchmarks/bench_frozen_dict.py
+"""
+import argparse
+import timeit
+from types import SimpleNamespace
+
+from chino.frozen_dict import FrozenDict, from_plain_dict, to_plain_dict
+
+
+def make_addict_frozen_dict():
+    """The previous implementation, which extends addict.Dict."""
+    from addict import Dict
+
+    class AddictFrozenDict(Dict):
+        FROZEN = '__frozen__'
+
+        def __init__(self, *args, **kwargs):
+            super(AddictFrozenDict, self).__init__(*args, **kwargs)
+            self.__dict__[AddictFrozenDict.FROZEN] = False
+
+        def __missing__(self, name):
+            if not self.__dict__[AddictFrozenDict.FROZEN]:
+                return super(AddictFrozenDict, self).__missing__(name)
+            raise AttributeError("Invalid key '{0}'".format(name))
+
+        def __setitem__(self, name, value):
+            if not self.__dict__[AddictFrozenDict.FROZEN]:
+                super(AddictFrozenDict, self).__setitem__(name, value)
+            elif name not in self:
+                raise KeyError("Non-existent key: '{0}'".format(name))
+            elif isinstance(self[name], AddictFrozenDict):
+                raise KeyError("Unable to reset FrozenDict at key '{0}'".format(name))
+            else:
+                super(AddictFrozenDict, self).__setitem__(name, value)
+
+        def freeze(self, set_freeze=True):
+            self.__dict__[AddictFrozenDict.FROZEN] = set_freeze
+            for v in self.values():
+                if isinstance(v, AddictFrozenDict):
+                    v.freeze(set_freeze)
+
+    return AddictFrozenDict
+
+
+def build(cls):
+    cfg = cls()
+    cfg.A.B.C = 1.
+    cfg.NAME = 'x'
+    cfg.freeze()
+    return cfg
+
+
+def recursive_to_plain_dict(frozen_dict, sep='__'):
+    """The previous to_plain_dict, which recurses on every call."""
+    out = dict()
+    for k, v in frozen_dict.items():
+        if isinstance(v, FrozenDict):
+            vdict = recursive_to_plain_dict(v, sep=sep)
+            for kk, vv in vdict.items():
+                out.update({sep.join([k, kk]): vv})
+        else:
+            out[k] = v
+    return out
+
+
+def build_large(num_groups=50, depth=3, num_leaves=10):
+    cfg = FrozenDict()
+    for g in range(num_groups):
+        node = cfg['G{}'.format(g)]
+        for d in range(depth - 1):
+            node = node['L{}'.format(d)]
+        for i in range(num_leaves):
+            node['V{}'.format(i)] = float(i)
+    cfg.freeze()
+    return cfg
+
+
+def build_plain(num_keys):
+    """Plain dict of num_keys leaves, 10 per node of depth 3."""
+    return {'G{0}__L{1}__V{2}'.format(i // 100, i // 10 % 10, i % 10): float(i)
+            for i in range(num_keys)}
+
+
+def build_by_set_path(plain_dict):
+    cfg = FrozenDict()
+    for k, v in plain_dict.items():
+        cfg.set_path(k.split('__'), v)
+    return cfg
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=1000000)
+    args = parser.parse_args()
+    classes = [('FrozenDict', FrozenDict)]
+    try:
+        classes.append(('addict FrozenDict', make_addict_frozen_dict()))
+    except ImportError:
+        print('addict is not installed, skipping the previous implementation.')
+    plain = SimpleNamespace(A=SimpleNamespace(B=SimpleNamespace(C=1.)), NAME='x')
+    results = [('plain attributes', timeit.timeit('cfg.A.B.C', globals={'cfg': plain},
+                                                  number=args.number), None)]
+    for name, cls in classes:
+        cfg = build(cls)
+        read = timeit.timeit('cfg.A.B.C', globals={'cfg': cfg}, number=args.number)
+        write = timeit.timeit('cfg.NAME = "y"', globals={'cfg': cfg}, number=args.number)
+        results.append((name, read, write))
+    for name, read, write in results:
+        line = '{0:<20s} read cfg.A.B.C: {1:6.1f} ns'.format(name, read / args.number * 1e9)
+        if write is not None:
+            line += '  write cfg.NAME: {0:6.1f} ns'.format(write / args.number * 1e9)
+        print(line)
+    cfg = build_large()
+    number = max(args.number // 1000, 1)
+    for name, fn in [('recursive', recursive_to_plain_dict), ('cached', to_plain_dict)]:
+        t = timeit.timeit(lambda: fn(cfg), number=number)
+        print('{0:<20s} to_plain_dict ({1} leaves): {2:8.1f} us'.format(
+            name, len(to_plain_dict(cfg)), t / number * 1e6))
+    paths = list(cfg.flatten())
+    t = timeit.timeit(lambda: [cfg.get_path(p) for p in paths], number=number)
+    print('{0:<20s} get_path: {1:6.1f} ns'.format('FrozenDict', t / number / len(paths) * 1e9))
+    # adding keys to another config should not invalidate the index of cfg
+    other = FrozenDict()
+
+    def _get_paths_after_adding_key():
+        other['K{}'.format(len(other))] = 0
+        return [cfg.get_path(p) for p in paths]
+    t = timeit.timeit(_get_paths_after_adding_key, number=number)
+    print('{0:<20s} get_path, keys added elsewhere: {1:6.1f} ns'.format(
+        'FrozenDict', t / number / len(paths) * 1e9))
+    # building configs should take linear time in the number of keys
+    number = max(args.number // 100000, 1)
+    for num_keys in (1000, 4000):
+        plain_dict = build_plain(num_keys)
+        for name, fn in [('from_plain_dict', from_plain_dict),
+                         ('set_path', build_by_set_path)]:
+            t = timeit.timeit(lambda: fn(plain_dict), number=number)
+            print('{0:<20s} build ({1} keys): {2:6.2f} us/key'.format(
+                name, num_keys, t / number / num_keys * 1e6))
+
+
+if __name__ == '__main__':
+    main()
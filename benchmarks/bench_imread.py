@@ -0,0 +1,68 @@
+"""Benchmark looped `imread` against `imread_batch`.
+
+Usage (with chino installed): python benchmarks/bench_imread.py --num 256 --size 640 480
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from chino.image import imread, imread_batch
+
+
+def make_images(folder, num, size):
+    rng = np.random.RandomState(0)
+    filenames = []
+    for i in range(num):
+        filename = os.path.join(folder, '{:06d}.jpg'.format(i))
+        image = rng.randint(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+        cv2.imwrite(filename, image)
+        filenames.append(filename)
+    return filenames
+
+
+def bench(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--num', type=int, default=256)
+    parser.add_argument('--size', type=int, nargs=2, default=(640, 480))
+    parser.add_argument('--dsize', type=int, nargs=2, default=(224, 224))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--reduced-decode', action='store_true',
+                        help='Enable reduced JPEG decoding.')
+    args = parser.parse_args()
+    folder = tempfile.mkdtemp()
+    try:
+        filenames = make_images(folder, args.num, args.size)
+        dsize = tuple(args.dsize)
+        reduced = args.reduced_decode
+        looped = bench(lambda: np.stack([imread(f, dsize=dsize, reduced_decode=reduced)
+                                         for f in filenames]),
+                       args.repeat)
+        batched = bench(lambda: imread_batch(filenames, dsize=dsize,
+                                             workers=args.workers,
+                                             reduced_decode=reduced),
+                        args.repeat)
+    finally:
+        shutil.rmtree(folder)
+    print('images: {0}, size: {1}, dsize: {2}'.format(args.num, args.size, dsize))
+    print('looped imread: {:.3f}s ({:.1f} img/s)'.format(looped, args.num / looped))
+    print('imread_batch:  {:.3f}s ({:.1f} img/s)'.format(batched, args.num / batched))
+    print('speedup: {:.2f}x'.format(looped / batched))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Benchmark the overhead of profiler scopes.
+
+Usage (with chino installed): python benchmarks/bench_timer.py
+"""
+import argparse
+import timeit
+
+from chino.timer import Profiler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=200000)
+    args = parser.parse_args()
+    prof = Profiler()
+
+    def _empty():
+        pass
+
+    def _scope():
+        with prof.scope('scope'):
+            pass
+
+    def _tic_toc():
+        prof.tic('scope')
+        prof.toc('scope')
+
+    @prof.scope('decorated')
+    def _decorated():
+        pass
+
+    base = timeit.timeit(_empty, number=args.number)
+    for mode in ('enabled', 'traced', 'disabled'):
+        prof.enabled = mode != 'disabled'
+        if mode == 'traced':
+            prof.start_trace(args.number)
+        else:
+            prof.stop_trace()
+        for name, fn in (('with scope', _scope), ('tic/toc', _tic_toc), ('decorator', _decorated)):
+            t = timeit.timeit(fn, number=args.number) - base
+            print('{0:<8s} {1:<12s} {2:8.1f} ns'.format(mode, name, t / args.number * 1e9))
+
+
+if __name__ == '__main__':
+    main()
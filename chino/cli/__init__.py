@@ -1,6 +1,8 @@
 import click
 
 from .exp import exp
+from .pack import pack
+from .trace import trace
 from .utils import touch_cli, config
 
 
@@ -13,3 +15,5 @@ def cli():
 cli.add_command(exp)
 cli.add_command(touch_cli)
 cli.add_command(config)
+cli.add_command(pack)
+cli.add_command(trace)
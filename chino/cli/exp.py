@@ -9,7 +9,7 @@ from typing import Optional, Dict
 import click
 
 from chino.cli.utils import touch
-from chino.io.fileio import load
+from chino.io.fileio import load, save
 
 
 PAT = re.compile(r'^E(\d\d)(-.*|$)')  # match Exx or Exx-xxxxx
@@ -65,8 +65,7 @@ def init(name: str, author: str, email: str) -> None:
     ):
         for exp_name in exist_exps:
             info['exps'].append({'name': exp_name, 'desc': None, 'entrypoint': None, 'commit_id': None})
-    with open(info_path, 'w') as f:
-        json.dump(info, f)
+    save(info_path, info)
     click.echo('Initialized experiment folder for project {0}'.format(name))
 
 
@@ -112,8 +111,7 @@ def new(annotation: str, desc: str, entrypoint: str) -> None:
           create_dir=True,
           executable=True)
     info['exps'].append({'name': exp_name, 'desc': desc, 'entrypoint': entry_file, 'commit_id': None})
-    with open(info['path'], 'w') as f:
-        json.dump(info, f)
+    save(info['path'], info)
     click.echo('Initialized experiment {0}'.format(exp_name))
 
 
@@ -144,8 +142,7 @@ def update(name: str, commit_id: str) -> None:
         commit_id = click.prompt('commit_id for {}'.format(exp_name))
     old_id = exp_info.get('commit_id', None)
     exp_info['commit_id'] = commit_id
-    with open(info['path'], 'w') as f:
-        json.dump(info, f)
+    save(info['path'], info)
     click.echo('Updated commit_id {0} -> {1} for {2}.'.format(old_id, commit_id, exp_name))
 
 
@@ -164,8 +161,7 @@ def pop():
     if click.confirm('Remove {0}?'.format(exp_path), abort=True):
         shutil.rmtree(exp_path)
         info['exps'].pop()
-        with open(info['path'], 'w') as f:
-            json.dump(info, f)
+        save(info['path'], info)
         click.echo('Removed experiment {0} from {1}.'.format(exp_name, exp_path))
 
 
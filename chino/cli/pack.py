@@ -0,0 +1,31 @@
+import click
+
+from chino.io.fileio import load
+from chino.io.shard import pack_shards
+
+
+@click.command()
+@click.argument('list_file')
+@click.argument('prefix')
+@click.option('--shard-size', type=int, default=1024,
+              help='Size of each shard in MB.')
+@click.option('--decode/--no-decode', default=False,
+              help='If specify, then store decoded arrays instead of file contents.')
+@click.option('--dsize', type=int, nargs=2, default=None,
+              help='Width and height to resize decoded images to.')
+@click.option('--gray/--no-gray', default=False,
+              help='If specify, then decode images to grayscale.')
+@click.option('--dtype', type=str, default='uint8',
+              help='Data type of decoded images.')
+@click.option('--scaled/--no-scaled', default=False,
+              help='If specify, then scale decoded images to [0., 1.].')
+def pack(list_file, prefix, shard_size, decode, dsize, gray, dtype, scaled):
+    """Pack files listed in LIST_FILE into shards with PREFIX."""
+    filenames = [f for f in load(list_file) if len(f) > 0]
+    kwargs = {}
+    if decode:
+        kwargs = dict(dtype=dtype, scaled=scaled, gray=gray,
+                      dsize=tuple(dsize) if dsize else None)
+    num_shards = pack_shards(filenames, prefix, shard_size << 20, decode, **kwargs)
+    click.echo('Packed {0} files into {1} shards with prefix {2}'.format(
+        len(filenames), num_shards, prefix))
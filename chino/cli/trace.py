@@ -0,0 +1,26 @@
+import click
+
+from chino.io.fileio import load
+from chino.timer import summarize_trace
+
+
+@click.group()
+def trace():
+    """Chrome trace tools."""
+    pass
+
+
+@trace.command()
+@click.argument('trace_file')
+@click.option('--top', '-n', type=int, default=20,
+              help='Number of scopes to print.')
+@click.option('--by-path/--by-name', default=False,
+              help='Group events by the full path of scopes instead of names.')
+def summarize(trace_file: str, top: int, by_path: bool) -> None:
+    """Print the top scopes by total time in TRACE_FILE."""
+    summary = summarize_trace(load(trace_file), by_path=by_path)
+    click.echo('{0:<48s} {1:>8s} {2:>12s} {3:>12s} {4:>12s}'.format(
+        'scope', 'count', 'total(ms)', 'mean(ms)', 'max(ms)'))
+    for name, count, total, longest in summary[:top]:
+        click.echo('{0:<48s} {1:>8d} {2:>12.3f} {3:>12.3f} {4:>12.3f}'.format(
+            name, count, total / 1e3, total / count / 1e3, longest / 1e3))
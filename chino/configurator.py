@@ -30,27 +30,184 @@ from a yaml file or command line to the global cfg.
 """
 import argparse
 import copy
+import difflib
+import functools
+import hashlib
 import logging
 import numbers
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
 from ast import literal_eval
-from collections import Iterable
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
 import six
 import numpy as np
 import yaml
 from .frozen_dict import FrozenDict
+from .io.fileio import load, load_array, save, _pack_oob, _unpack_oob
 
 logger = logging.getLogger(__name__)
 cfg = FrozenDict()  # for importing
 
+# The libyaml based loader is much faster if available.
+_YamlLoader = getattr(yaml, 'CFullLoader', yaml.FullLoader)
 
-def merge_from_yml(file_name, to_cfg=None):
-    """Merge from yaml file."""
-    with open(file_name, 'r') as f:
-        d = yaml.load(f)
+
+class _CfgLoader(_YamlLoader):
+    """Loader of config files, which supports arrays stored in external
+    files, memory-mapped read-only by `load_array`:
+        ANCHORS: !ndarray anchors.npy
+        CLASS_WEIGHTS: !ndarray {path: weights.npz, key: train}
+    Relative paths are relative to the directory of the config file."""
+    base_dir = ''
+    has_arrays = False
+
+
+def _construct_ndarray(loader, node):
+    if isinstance(node, yaml.MappingNode):
+        spec = loader.construct_mapping(node)
+        path, key = spec['path'], spec.get('key')
+    else:
+        path, key = loader.construct_scalar(node), None
+    loader.has_arrays = True
+    return load_array(os.path.join(loader.base_dir, path), key)
+
+
+_CfgLoader.add_constructor('!ndarray', _construct_ndarray)
+
+
+def merge_from_yml(file_name, to_cfg=None, cache=None):
+    """Merge from yaml file.
+    The file may inherit from other yaml files by `_base_: path` (or a list
+    of paths, merged in order), relative to the file, whose values it
+    overrides.  Parsed files are cached in memory until they are modified,
+    so that merging many configs sharing the same bases parses each file
+    only once.
+
+    If cache is True or a directory, the merged and coerced values are cached
+    there (under $HOME/.chino/cache/cfg if True), keyed by the content of the
+    yaml file and the current content of to_cfg, and checked against the
+    content of its bases.  Merging the same file into the same cfg again then
+    skips both parsing and merging.  Configs with arrays from external files
+    (see `_CfgLoader`) are not cached, since their data should be mapped
+    instead of pickled, and the array files are not checked for changes."""
     if to_cfg is None:
         to_cfg = cfg
     assert isinstance(to_cfg, FrozenDict)
-    _merge_dict_into_Dict(d, to_cfg)
+    entry = None
+    if cache:
+        cache_dir = cache if isinstance(cache, six.string_types) else \
+            os.path.join(os.path.expanduser('~'), '.chino', 'cache', 'cfg')
+        h = hashlib.sha1(_file_digest(file_name).encode('utf-8'))
+        h.update(to_cfg.content_hash().encode('utf-8'))
+        entry = os.path.join(cache_dir, h.hexdigest() + '.pkl')
+        if os.path.isfile(entry):
+            try:
+                compiled = load(entry)
+                valid = all(_file_digest(path) == digest
+                            for path, digest in compiled['deps'])
+            except Exception as e:
+                logger.warning('Unable to load cached config %s: %s', entry, e)
+            else:
+                if valid:
+                    for path, v in compiled['updates']:
+                        to_cfg.set_path(path, v)
+                    return
+    d, deps, has_arrays = _resolve_yml(file_name)
+    updates = [] if entry is not None and not has_arrays else None
+    _merge_dict_into_Dict(d, to_cfg, updates=updates)
+    if updates is not None:
+        try:
+            save(entry, {'deps': deps, 'updates': updates}, create_dir=True)
+        except Exception as e:
+            logger.warning('Unable to cache config to %s: %s', entry, e)
+
+
+# realpath -> (mtime_ns, size, parsed dict, sha1 of content)
+_PARSED_YML = {}
+
+
+def _parse_yml(path):
+    """Returns the parsed dict and the digest of the yaml file at path (a
+    realpath), and whether it has arrays from external files.  Files without
+    such arrays are cached until they are modified.  The dict is shared and
+    should not be modified."""
+    st = os.stat(path)
+    cached = _PARSED_YML.get(path)
+    if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2], cached[3], False
+    with open(path, 'rb') as f:
+        content = f.read()
+    loader = _CfgLoader(content)
+    loader.base_dir = os.path.dirname(path)
+    try:
+        d = loader.get_single_data()
+    finally:
+        loader.dispose()
+    if d is None:
+        d = {}
+    digest = hashlib.sha1(content).hexdigest()
+    if not loader.has_arrays:
+        # arrays are mapped again, in case their files are modified
+        _PARSED_YML[path] = (st.st_mtime_ns, st.st_size, d, digest)
+    return d, digest, loader.has_arrays
+
+
+def _file_digest(file_name):
+    """Returns the sha1 digest of the content of a file, reusing the one of
+    the parsed file if it is not modified."""
+    path = os.path.realpath(file_name)
+    cached = _PARSED_YML.get(path)
+    if cached is not None:
+        st = os.stat(path)
+        if cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[3]
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _resolve_yml(file_name, stack=()):
+    """Returns the dict of yaml file_name with its bases merged, the list of
+    (path, digest) of all files it depends on, and whether any of them has
+    arrays from external files."""
+    path = os.path.realpath(file_name)
+    if path in stack:
+        raise ValueError('Cyclic _base_ in config files: {0}'.format(
+            ' -> '.join(stack + (path,))))
+    d, digest, has_arrays = _parse_yml(path)
+    deps = [(path, digest)]
+    if '_base_' not in d:
+        return d, deps, has_arrays
+    bases = d['_base_']
+    if isinstance(bases, six.string_types):
+        bases = [bases]
+    merged = {}
+    for base in bases:
+        base_d, base_deps, base_has_arrays = _resolve_yml(
+            os.path.join(os.path.dirname(path), base), stack + (path,))
+        merged = _merge_dicts(merged, base_d)
+        deps.extend(base_deps)
+        has_arrays = has_arrays or base_has_arrays
+    merged = _merge_dicts(merged, {k: v for k, v in d.items() if k != '_base_'})
+    return merged, deps, has_arrays
+
+
+def _merge_dicts(a, b):
+    """Returns a new dict of a recursively updated by b, without modifying a
+    or b."""
+    out = dict(a)
+    for k, v in b.items():
+        if isinstance(v, dict) and isinstance(out.get(k), dict):
+            out[k] = _merge_dicts(out[k], v)
+        else:
+            out[k] = v
+    return out
 
 
 def merge_from_parser_args(args, to_cfg=None):
@@ -61,6 +218,34 @@ def merge_from_parser_args(args, to_cfg=None):
     _merge_namespace_into_Dict(args, to_cfg)
 
 
+def merge_from_argv(argv=None, to_cfg=None):
+    """Merge overrides given on command line (sys.argv[1:] by default) as
+    `SOLVER.LR=0.1` or `--SOLVER.LR 0.1`, where the latter takes multiple
+    values for sequences, e.g. `--IMG_SIZE 256 256 3`.  Values are decoded
+    and coerced in the same way as merging from a yaml file, and N-D arrays
+    are given by the path of a .npy file.
+
+    Only the given keys are looked up, so it is much faster than
+    `cfg_parser` for large configs; the full parser is only built to print
+    the help if `-h`/`--help` is given.  Unknown keys raise KeyError with
+    suggestions of similar keys."""
+    if to_cfg is None:
+        to_cfg = cfg
+    assert isinstance(to_cfg, FrozenDict)
+    if argv is None:
+        argv = sys.argv[1:]
+    if '-h' in argv or '--help' in argv:
+        cfg_parser(to_cfg).parse_args(['--help'])
+    for full_key, values in _split_overrides(argv, to_cfg):
+        default = to_cfg.get_path(full_key, _NO_DEFAULT)
+        if default is _NO_DEFAULT or isinstance(default, FrozenDict):
+            matches = difflib.get_close_matches(full_key, list(to_cfg.flatten()))
+            hint = '; did you mean {0}?'.format(
+                ', '.join(matches)) if len(matches) > 0 else ''
+            raise KeyError('Non-existent config key: {0}{1}'.format(full_key, hint))
+        to_cfg.set_path(full_key, _decode_override(values, default, full_key))
+
+
 def cfg_parser(to_cfg=None):
     """Returns a parser with options and default values specified from
     a cfg FrozenDict."""
@@ -72,19 +257,358 @@ def cfg_parser(to_cfg=None):
     return parser
 
 
-def _convert_Dict_to_parser(D, parser, prefix=''):
-    """Recursively traverse D and put entries into parser."""
-    for k, v in D.items():
-        arg_name = '--' + prefix + k
+def expand_sweep(base_cfg, spec, shard=None, seed=0):
+    """Lazily yields configs derived from base_cfg for all points of a sweep.
+
+    spec is one of
+    - {'grid': {key: values, ...}}, or simply {key: values, ...}: cartesian
+      product of values, with the last key varying fastest;
+    - {'zip': {key: values, ...}}: values of all keys zipped together;
+    - {'random': {key: values_or_fn, ...}, 'num_samples': n}: n random
+      points, each value is drawn uniformly from values or returned by
+      fn(rng), where rng is a numpy Generator;
+    - a list of the above, whose points are concatenated.
+    Keys are dotted, e.g. 'SOLVER.LR'.  Each key is validated and each listed
+    value is decoded and coerced only once, rather than once per config.
+    As with `FrozenDict.derive`, configs share unchanged subtrees with
+    base_cfg, and assigning to any of them does not affect the others.
+
+    If shard is (i, n) or 'i/n', only every n-th point starting from the i-th
+    is expanded, so that n nodes together expand the whole sweep.  Random
+    points depend only on seed and their index, hence are the same on every
+    shard.
+    """
+    assert isinstance(base_cfg, FrozenDict)
+    segments = _sweep_segments(base_cfg, spec, seed)
+    total = sum(size for size, _ in segments)
+    if shard is None:
+        shard = (0, 1)
+    elif isinstance(shard, six.string_types):
+        shard = tuple(int(v) for v in shard.split('/'))
+    index, num_shards = shard
+    if not 0 <= index < num_shards:
+        raise ValueError('Invalid shard: {}'.format(shard))
+    offset = 0
+    for size, point in segments:
+        # first index in this segment that belongs to the shard
+        start = (index - offset) % num_shards
+        for i in range(start, size, num_shards):
+            yield base_cfg._derive(point(i), coerce=False)
+        offset += size
+
+
+def _sweep_segments(base_cfg, spec, seed):
+    """Returns a list of (size, point), where point(i) returns the coerced
+    (key, value) items of the i-th point."""
+    if isinstance(spec, (list, tuple)):
+        segments = []
+        for sub_spec in spec:
+            segments.extend(_sweep_segments(base_cfg, sub_spec, seed + len(segments)))
+        return segments
+    spec = dict(spec)
+    if 'random' in spec:
+        params = spec['random']
+        num_samples = spec['num_samples']
+        choices = {}
+        for k, v in params.items():
+            default = _lookup_leaf(base_cfg, k)
+            choices[k] = (v, default) if callable(v) else _coerce_all(v, default, k)
+
+        def _random_point(i):
+            rng = np.random.default_rng([seed, i])
+            items = []
+            for k, v in choices.items():
+                if isinstance(v, tuple):  # (fn, default)
+                    value = _coerce_value(_decode_value(v[0](rng)), v[1], k)
+                else:
+                    value = v[rng.integers(len(v))]
+                items.append((k, value))
+            return items
+        return [(num_samples, _random_point)]
+    if 'zip' in spec:
+        values = {k: _coerce_all(v, _lookup_leaf(base_cfg, k), k)
+                  for k, v in spec['zip'].items()}
+        sizes = set(len(v) for v in values.values())
+        if len(sizes) > 1:
+            raise ValueError('Zipped values have different lengths: {}'.format(sizes))
+        size = sizes.pop() if len(sizes) > 0 else 0
+        return [(size, lambda i: [(k, v[i]) for k, v in values.items()])]
+    grid = spec.get('grid', spec)
+    values = [(k, _coerce_all(v, _lookup_leaf(base_cfg, k), k)) for k, v in grid.items()]
+    size = int(np.prod([len(v) for _, v in values])) if len(values) > 0 else 0
+
+    def _grid_point(i):
+        items = []
+        for k, v in reversed(values):
+            i, j = divmod(i, len(v))
+            items.append((k, v[j]))
+        return items[::-1]
+    return [(size, _grid_point)]
+
+
+def _lookup_leaf(D, full_key):
+    """Returns the value at dotted full_key, which should be a leaf."""
+    try:
+        node = D.get_path(full_key)
+    except KeyError:
+        raise KeyError('Non-existent config key: {}'.format(full_key))
+    if isinstance(node, FrozenDict):
+        raise KeyError("Unable to reset FrozenDict at key '{0}'".format(full_key))
+    return node
+
+
+def _coerce_all(values, default, full_key):
+    return [_coerce_value(_decode_value(v), default, full_key) for v in values]
+
+
+def memoize_on_cfg(maxsize=128, cache_dir=None):
+    """Decorator memoizing fn(cfg, *args, **kwargs), where cfg is a (sub)tree
+    of FrozenDict, keyed by the content hash of cfg and the pickled other
+    arguments.  Results are kept in an in-memory LRU cache of maxsize entries
+    and, if cache_dir is not None, also pickled under cache_dir, so that they
+    are computed once per unique setting across runs and processes.
+
+    Example:
+        @memoize_on_cfg(cache_dir='/tmp/cache')
+        def build_vocab(data_cfg):
+            ...
+        vocab = build_vocab(cfg.DATA)
+    """
+    def decorator(fn):
+        memo = OrderedDict()
+        lock = threading.Lock()
+        name = '{0}.{1}'.format(fn.__module__, fn.__qualname__)
+
+        @functools.wraps(fn)
+        def wrapper(cfg_, *args, **kwargs):
+            assert isinstance(cfg_, FrozenDict)
+            h = hashlib.sha1(name.encode('utf-8'))
+            h.update(cfg_.content_hash().encode('utf-8'))
+            h.update(pickle.dumps((args, sorted(kwargs.items())), protocol=4))
+            key = h.hexdigest()
+            with lock:
+                if key in memo:
+                    memo.move_to_end(key)
+                    return memo[key]
+            entry = None if cache_dir is None else \
+                os.path.join(cache_dir, fn.__name__ + '-' + key + '.pkl')
+            found = False
+            if entry is not None and os.path.isfile(entry):
+                try:
+                    result = load(entry)
+                    found = True
+                except Exception as e:
+                    logger.warning('Unable to load memoized result %s: %s', entry, e)
+            if not found:
+                result = fn(cfg_, *args, **kwargs)
+                if entry is not None:
+                    save(entry, result, create_dir=True)
+            with lock:
+                memo[key] = result
+                while len(memo) > maxsize:
+                    memo.popitem(last=False)
+            return result
+
+        wrapper.cache_clear = memo.clear
+        return wrapper
+    return decorator
+
+
+def share_cfg(to_share=None, path=None):
+    """Publishes a frozen config once, so that worker processes can attach to
+    it without unpickling copies of its numpy arrays.  The config is pickled
+    with out-of-band buffers into shared memory, or into the file at path
+    (which should end with `.pkl`) if given, e.g. on a tmpfs.  Returns a
+    `SharedCfg` handle, which is cheap to pass to workers.
+
+    Example:
+        shared = share_cfg(cfg)
+        # in workers, e.g. in the initializer of a pool
+        worker_cfg = shared.attach()
+        # in the main process, after all workers are done
+        shared.unlink()
+    """
+    if to_share is None:
+        to_share = cfg
+    assert isinstance(to_share, FrozenDict)
+    if not to_share.is_frozen():
+        raise ValueError('Only frozen configs can be shared.')
+    if path is not None:
+        save(path, to_share, create_dir=True, out_of_band=True)
+        return SharedCfg(path=path)
+    chunks, size = _pack_oob(to_share)
+    shm = _SharedMemory(create=True, size=size)
+    for offset, chunk in chunks:
+        chunk = memoryview(chunk)
+        shm.buf[offset:offset + chunk.nbytes] = chunk
+    handle = SharedCfg(name=shm.name)
+    handle._shm = shm
+    return handle
+
+
+class SharedCfg(object):
+    """Handle of a config published by `share_cfg`, by the name of the shared
+    memory block or the path of the file.  Only the location is pickled."""
+
+    def __init__(self, name=None, path=None):
+        self.name = name
+        self.path = path
+        self._shm = None
+        self._cfg = None
+
+    def __getstate__(self):
+        return {'name': self.name, 'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def attach(self):
+        """Returns the shared config, which is frozen and cannot be assigned
+        to (use derive() for variants).  Numpy arrays in it are read-only
+        views into the shared memory or the mapped file.  The config is
+        unpickled once per handle."""
+        if self._cfg is None:
+            if self.path is not None:
+                shared = load(self.path)
+            else:
+                if self._shm is None:
+                    self._shm = _open_shared_memory(self.name)
+                shared = _unpack_oob(self._shm.buf.toreadonly())
+            shared.freeze()
+            shared._mark_readonly()
+            self._cfg = shared
+        return self._cfg
+
+    def unlink(self):
+        """Removes the shared config, which should be called once by the
+        publishing process after all workers are done.  Attached configs
+        remain valid in processes which still map them.  Unlinking a config
+        which has been removed already does nothing."""
+        self._cfg = None
+        if self.path is not None:
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+            return
+        shm = self._shm
+        self._shm = None
+        if shm is None:
+            try:
+                shm = _open_shared_memory(self.name)
+            except FileNotFoundError:
+                return  # unlinked already
+        try:
+            shm.close()
+        except BufferError:
+            pass  # still referenced by arrays, unmapped once they are freed
+        if not hasattr(shm, '_track'):
+            # python<3.13 unregisters the block on unlink, so register it
+            # in case _open_shared_memory has unregistered it
+            resource_tracker.register(shm._name, 'shared_memory')
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            if not hasattr(shm, '_track'):
+                resource_tracker.unregister(shm._name, 'shared_memory')
+
+
+class _SharedMemory(shared_memory.SharedMemory):
+
+    def __del__(self):
+        try:
+            self.close()
+        except BufferError:
+            pass  # still referenced by arrays, unmapped once they are freed
+
+
+def _open_shared_memory(name):
+    try:
+        # not tracked, otherwise the block is removed once the attaching
+        # process exits (python>=3.13)
+        return _SharedMemory(name=name, track=False)
+    except TypeError:
+        # python<3.13 always tracks the block, so unregister it by hand
+        shm = _SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+_NO_DEFAULT = object()
+
+
+def _split_overrides(argv, to_cfg):
+    """Yields (dotted key, value) of overrides in argv, where value is a list
+    of the arguments of `--key v1 v2 ...`.  As for argparse, the first
+    argument after `--key` is always a value, even if it contains `=`.  Keys
+    of sequences take all arguments up to the next `--key` or `key=value`,
+    and other keys take a single argument."""
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        i += 1
+        key = arg[2:] if arg.startswith('--') else arg
+        if '=' in key:
+            yield tuple(key.split('=', 1))
+        elif arg.startswith('--'):
+            values = []
+            if i < len(argv) and not argv[i].startswith('--'):
+                values.append(argv[i])
+                i += 1
+                if _takes_values(to_cfg.get_path(key, None)):
+                    while i < len(argv) and not argv[i].startswith('--') \
+                            and '=' not in argv[i]:
+                        values.append(argv[i])
+                        i += 1
+            yield key, values
+        else:
+            raise ValueError('Unrecognized argument: {0}, overrides should be '
+                             'given as key=value or --key value'.format(arg))
+
+
+def _takes_values(default):
+    """Whether an override of default takes multiple values on command line."""
+    return isinstance(default, (list, tuple)) or \
+        (isinstance(default, np.ndarray) and default.ndim == 1 and
+         not isinstance(default, np.memmap))
+
+
+def _decode_override(values, default, full_key):
+    """Decodes and coerces an override given by merge_from_argv, which is a
+    string, or a list of strings for `--key v1 v2 ...`."""
+    if isinstance(values, list):
+        if _takes_values(default):
+            value = [_decode_value(v) for v in values]
+            if len(value) == 1 and isinstance(value[0], (list, tuple)):
+                value = value[0]  # e.g. `--STEPS [10,20]`
+            return _coerce_value(value, default, full_key)
+        if len(values) != 1:
+            raise ValueError('Expected a single value for key {0}, '
+                             'got {1}'.format(full_key, values))
+        values = values[0]
+    if isinstance(default, bool):
+        value = _str2bool(values)
+    elif isinstance(default, np.ndarray) and \
+            (default.ndim > 1 or isinstance(default, np.memmap)):
+        value = load_array(values)
+    else:
+        value = _decode_value(values)
+    return _coerce_value(value, default, full_key)
+
+
+def _convert_Dict_to_parser(D, parser):
+    """Put all leaves of D into parser, named by their dotted paths."""
+    for k, v in D.flatten().items():
+        arg_name = '--' + k
         help_template = ("Option '{0}' of type '{1}' with "
                          "default value '{2}'".format(k, type(v).__name__, v))
-        if isinstance(v, FrozenDict):
-            parser = _convert_Dict_to_parser(v, parser, k + '.')
-        elif isinstance(v, six.string_types):
+        if isinstance(v, six.string_types):
             parser.add_argument(arg_name, type=str, default=v,
                                 help=help_template)
+        elif isinstance(v, np.ndarray) and (v.ndim > 1 or isinstance(v, np.memmap)):
+            # N-D arrays are given by the path of a .npy file
+            parser.add_argument(arg_name, type=load_array, default=v,
+                                help=help_template)
         elif isinstance(v, np.ndarray):
-            # NOTE: only 1d array for numpy parser is supported.
+            # 1-D arrays are given by their values
             parser.add_argument(arg_name, action=_StoreAsNumpyArray,
                                 nargs=v.size, type=type(v.item(0)), default=v,
                                 help=help_template)
@@ -98,8 +622,8 @@ def _convert_Dict_to_parser(D, parser, prefix=''):
         elif isinstance(v, list):
             # NOTE: match list before any other iterables, assuming a list
             # may be of arbitrary lenth.
-            parser.add_argument(arg_name, type=type(v[0]), nargs='*', default=v,
-                                help=help_template)
+            parser.add_argument(arg_name, type=type(v[0]) if len(v) > 0 else _decode_value,
+                                nargs='*', default=v, help=help_template)
         elif isinstance(v, Iterable):
             # Enforce list/tuple to have same length
             parser.add_argument(arg_name, type=type(v[0]), nargs=len(v),
@@ -130,8 +654,10 @@ class _StoreAsNumpyArray(argparse._StoreAction):
                                                         values, option_string)
 
 
-def _merge_dict_into_Dict(d, D, stack=None):
-    """Merge python dict d to entries in D."""
+def _merge_dict_into_Dict(d, D, stack=None, updates=None):
+    """Merge python dict d to entries in D.
+    If updates is not None, (path, value) of all merged entries are appended
+    to it."""
     assert isinstance(d, dict)
     assert isinstance(D, FrozenDict)
 
@@ -140,29 +666,26 @@ def _merge_dict_into_Dict(d, D, stack=None):
         if k not in D:
             raise KeyError('Non-existent config key: {}'.format(full_key))
 
-        v = copy.deepcopy(v_)
-
         # do merging
-        if isinstance(v, dict):
+        if isinstance(v_, dict):
             stack_push = [k] if stack is None else stack + [k]
-            _merge_dict_into_Dict(v, D[k], stack=stack_push)
+            _merge_dict_into_Dict(v_, D[k], stack=stack_push, updates=updates)
         else:
-            v = _decode_value(v)
+            # only copy leaves, instead of copying subtrees at every level,
+            # and never copy (possibly memory-mapped) arrays
+            v = _decode_value(v_ if isinstance(v_, np.ndarray) else copy.deepcopy(v_))
             D[k] = _coerce_value(v, D[k], full_key)
+            if updates is not None:
+                updates.append((tuple(stack or []) + (k,), D[k]))
 
 
-def _merge_namespace_into_Dict(args, D, stack=None):
+def _merge_namespace_into_Dict(args, D):
     """Merge namespace args from ArgumentParser into FrozenDict D."""
     assert isinstance(D, FrozenDict)
 
-    for k, v in D.items():
-        if isinstance(v, FrozenDict):
-            stack_push = [k] if stack is None else stack + [k]
-            _merge_namespace_into_Dict(args, v, stack_push)
-        else:
-            full_key = '.'.join(stack) + '.' + k if stack is not None else k
-            assert hasattr(args, full_key)
-            D[k] = _coerce_value(getattr(args, full_key), v, full_key)
+    for full_key, v in D.flatten().items():
+        assert hasattr(args, full_key)
+        D.set_path(full_key, _coerce_value(getattr(args, full_key), v, full_key))
 
 
 def _decode_value(v):
@@ -180,6 +703,15 @@ def _decode_value(v):
 
 def _coerce_value(value_a, value_b, full_key):
     """Coerce value_a to value_b with possible type conversion."""
+    if isinstance(value_a, np.ndarray) and isinstance(value_b, np.ndarray):
+        # keep arrays (e.g. mapped from files) instead of converting
+        # (copying) them
+        if value_a.dtype != value_b.dtype:
+            raise ValueError(
+                'Type mismatch (array of {} vs. {}) for key {}'.format(
+                    value_a.dtype, value_b.dtype, full_key)
+            )
+        return value_a
     type_a, type_b = type(value_a), type(value_b)
     if type_a == type_b:
         return value_a
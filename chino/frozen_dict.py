@@ -1,50 +1,621 @@
-from addict import Dict
+import copy
+import hashlib
+import weakref
+import numpy as np
 
+# Source of the stamps which mark FrozenDicts as modified (see _touch).
+_TICK = [0]
+_MISSING = object()
 
-class FrozenDict(Dict):
-    """FrozenDict extends addict.Dict in a similar way as AttrDict in
-    Detectron.  When the dict is frozen, one can no longer access
-    non-existent fields.  Moreover, the keys are `frozen` in the sense that
-    no new keys can be added."""
 
-    FROZEN = '__frozen__'
+class FrozenDict(dict):
+    """FrozenDict is an attribute-accessible dict, in a similar way as
+    AttrDict in Detectron.  Accessing a missing field of an unfrozen dict
+    returns an empty child, which is attached once something is assigned to
+    it, so that `fd.SVM.C = 100.` creates `fd.SVM`.  When the dict is frozen,
+    one can no longer access non-existent fields.  Moreover, the keys are
+    `frozen` in the sense that no new keys can be added.
+
+    Nodes keep their state in __slots__, and fields whose names are valid
+    attributes are mirrored into the instance __dict__, so that reading
+    `cfg.a.b.c` is a plain attribute lookup and `__getattr__` is only called
+    for missing fields.  As with addict, fields named like methods (e.g.
+    `items`) are only accessible by `cfg['items']`.
+
+    Subtrees which a derived config shares with its base are borrowed: they
+    are not mirrored, and are replaced by a copy on first access by
+    attribute, `[]` or `get`, so that assignments to a variant never reach
+    its base."""
+
+    __slots__ = ('__dict__', '__weakref__', '_frozen', '_readonly', '_hash',
+                 '_pending', '_parents', '_variants', '_borrowed', '_stamps',
+                 '_index', '_flat')
 
     def __init__(self, *args, **kwargs):
-        super(FrozenDict, self).__init__(*args, **kwargs)
-        self.__dict__[FrozenDict.FROZEN] = False
+        _init_slots(self)
+        for arg in args:
+            if not arg:
+                continue
+            items = arg.items() if isinstance(arg, dict) else arg
+            for k, v in items:
+                self[k] = _hook(v)
+        for k, v in kwargs.items():
+            self[k] = _hook(v)
+
+    def __getattr__(self, name):
+        # only called for fields which are not mirrored, i.e. missing or
+        # borrowed ones
+        return self[name]
+
+    def __getitem__(self, name):
+        borrowed = self._borrowed
+        if borrowed is not None and name in borrowed:
+            return _adopt(self, name)
+        return dict.__getitem__(self, name)
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def __setattr__(self, name, value):
+        if _is_reserved(type(self), name):
+            raise AttributeError("'FrozenDict' object attribute "
+                                 "'{0}' is read-only".format(name))
+        self[name] = value
+
+    def __delattr__(self, name):
+        del self[name]
 
     def __missing__(self, name):
         """After freezing, raise error for missing fields."""
-        if not self.__dict__[FrozenDict.FROZEN]:
-            return super(FrozenDict, self).__missing__(name)
-        else:
+        if self._frozen:
             raise AttributeError("Invalid key '{0}'".format(name))
+        if name.startswith('__') and name.endswith('__'):
+            # do not create children for special names probed by libraries
+            raise AttributeError(name)
+        child = self.__class__()
+        object.__setattr__(child, '_pending', (self, name))
+        return child
 
     def __setitem__(self, name, value):
         """After freezing, disable setting values for invalid fields."""
-        if not self.__dict__[FrozenDict.FROZEN]:
-            super(FrozenDict, self).__setitem__(name, value)
-        else:
+        if self._readonly:
+            raise KeyError("Unable to set key '{0}' of a read-only FrozenDict, "
+                           "use derive() instead".format(name))
+        if self._frozen:
             # Check whether name exists
             if name not in self:
                 raise KeyError("Non-existent key: '{0}'".format(name))
             # Check whether the field is at end node
-            elif isinstance(self[name], FrozenDict):
+            elif isinstance(dict.__getitem__(self, name), FrozenDict):
                 raise KeyError("Unable to reset FrozenDict at "
                                "key '{0}'".format(name))
+        old = dict.get(self, name, self)
+        # new key (the default is self), or a subtree added or replaced
+        _touch(self, isinstance(value, FrozenDict) or isinstance(old, FrozenDict))
+        if self._borrowed is not None:
+            self._borrowed.discard(name)
+        _set(self, name, value)
+        if old is not value and isinstance(old, FrozenDict):
+            _unlink(self, old)
+        pending = self._pending
+        if pending is not None:
+            # attach a child created by __missing__ to its parent
+            object.__setattr__(self, '_pending', None)
+            pending[0][pending[1]] = self
+
+    def __delitem__(self, name):
+        if self._readonly:
+            raise KeyError("Unable to delete key '{0}' of a read-only "
+                           "FrozenDict".format(name))
+        _touch(self, True)
+        if self._borrowed is not None:
+            self._borrowed.discard(name)
+        old = dict.pop(self, name)
+        self.__dict__.pop(name, None)
+        if isinstance(old, FrozenDict):
+            _unlink(self, old)
+
+    def pop(self, name, *args):
+        if name in self:
+            value = self[name]
+            del self[name]
+            return value
+        return dict.pop(self, name, *args)
+
+    def popitem(self):
+        if len(self) == 0:
+            raise KeyError('popitem(): dictionary is empty')
+        name = next(reversed(self.keys()))
+        return name, self.pop(name)
+
+    def clear(self):
+        for name in list(self.keys()):
+            del self[name]
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __reduce__(self):
+        return _rebuild, (self.__class__, dict(self), self._frozen)
+
+    def __copy__(self):
+        return self._shallow_copy()
+
+    def __deepcopy__(self, memo):
+        out = self.__class__()
+        memo[id(self)] = out
+        for k, v in self.items():
+            _set(out, copy.deepcopy(k, memo), copy.deepcopy(v, memo))
+        object.__setattr__(out, '_frozen', self._frozen)
+        return out
+
+    def copy(self):
+        """Shallow copy."""
+        return self._shallow_copy()
+
+    def deepcopy(self):
+        return copy.deepcopy(self)
+
+    def to_dict(self):
+        """Converts to nested python dicts."""
+        out = {}
+        for k, v in self.items():
+            if isinstance(v, FrozenDict):
+                v = v.to_dict()
+            elif isinstance(v, (list, tuple)):
+                v = type(v)(item.to_dict() if isinstance(item, FrozenDict) else item
+                            for item in v)
+            out[k] = v
+        return out
+
+    def update(self, *args, **kwargs):
+        """Recursively update values from dicts."""
+        other = {}
+        if len(args) > 1:
+            raise TypeError('update expected at most 1 argument, got {}'.format(len(args)))
+        if len(args) > 0:
+            other.update(args[0])
+        other.update(kwargs)
+        for k, v in other.items():
+            if k in self and isinstance(self[k], dict) and isinstance(v, dict):
+                self[k].update(v)
             else:
-                super(FrozenDict, self).__setitem__(name, value)
+                self[k] = v
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
 
     def is_frozen(self):
         """Check whether the current dict is frozen."""
-        return self.__dict__[FrozenDict.FROZEN]
+        return self._frozen
 
     def freeze(self, set_freeze=True):
         """Freeze (or change the state of freezing) of current dict."""
-        self.__dict__[FrozenDict.FROZEN] = set_freeze
+        object.__setattr__(self, '_frozen', set_freeze)
+        borrowed = self._borrowed or ()
+        for k, v in dict.items(self):
+            # borrowed subtrees are copied with the state of current dict
+            if isinstance(v, FrozenDict) and k not in borrowed:
+                v.freeze(set_freeze)
+
+    def content_hash(self):
+        """Returns a stable hex digest of the content of current dict, which
+        does not depend on the order of keys.  Numpy arrays are hashed by
+        dtype, shape and data, and tuples and lists are distinguished.  The
+        digest is cached until current dict or one of its descendants is
+        assigned to."""
+        cached = self._hash
+        stamp = self._stamps[0]
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        h = hashlib.sha1()
+        _hash_items(h, self)
+        digest = h.hexdigest()
+        object.__setattr__(self, '_hash', (stamp, digest))
+        return digest
+
+    def get_path(self, path, default=_MISSING):
+        """Returns the field (a leaf or a subtree) at a dotted path such as
+        'SOLVER.LR', or a sequence of keys.  If the path does not exist,
+        returns default if given and raises KeyError otherwise.
+
+        Paths are looked up in a flat index of all fields, which is built on
+        first use and kept until keys are added to or removed from current
+        dict or its descendants."""
+        if not isinstance(path, str):
+            path = '.'.join(str(k) for k in path)
+        entry = self._path_index()[0].get(path)
+        if entry is None:
+            if default is _MISSING:
+                raise KeyError("Non-existent key: '{0}'".format(path))
+            return default
+        return dict.__getitem__(entry[0], entry[1])
+
+    def set_path(self, path, value):
+        """Sets the field at a dotted path or a sequence of keys, with the
+        same checks as setting it by attributes.  Missing intermediate nodes
+        are created unless the dict is frozen.
+
+        The path is looked up in the index of get_path if it is up to date,
+        and walked otherwise, so that building a config by set_path does not
+        rebuild the index after every new key."""
+        parts = path.split('.') if isinstance(path, str) else list(path)
+        cached = self._index
+        if cached is not None and cached[0] == self._stamps[1]:
+            entry = cached[1][0].get(
+                path if isinstance(path, str) else '.'.join(str(k) for k in parts))
+            if entry is not None and entry[2]:
+                entry[0][entry[1]] = value
+                return
+        node = self
+        for k in parts[:-1]:
+            if k not in node:
+                if self._frozen:
+                    raise KeyError("Non-existent key: '{0}'".format(path))
+                node[k] = self.__class__()
+            child = node[k]
+            if not isinstance(child, FrozenDict):
+                raise KeyError("Unable to set '{0}' under a non-FrozenDict "
+                               "field".format(path))
+            node = child
+        node[parts[-1]] = value
+
+    def flatten(self, sep='.'):
+        """Returns a new dict mapping the joined paths of all leaves to their
+        values, e.g. {'SOLVER.LR': 0.1}.  Empty subtrees are omitted.
+
+        The result is cached until current dict or one of its descendants is
+        assigned to, so that flattening a frozen config repeatedly (e.g. for
+        logging) only costs a dict copy.  As for content_hash, values modified
+        in place are not tracked."""
+        cached = self._flat
+        stamp = self._stamps[0]
+        if cached is not None and cached[0] == stamp and cached[1] == sep:
+            return dict(cached[2])
+        leaves = self._path_index()[1]
+        getitem = dict.__getitem__
+        if sep == '.':
+            flat = {full_key: getitem(node, k) for full_key, _, node, k in leaves}
+        else:
+            flat = {sep.join(parts): getitem(node, k) for _, parts, node, k in leaves}
+        object.__setattr__(self, '_flat', (stamp, sep, flat))
+        return dict(flat)
+
+    def _path_index(self):
+        """Returns the cached (paths, leaves) index, where paths maps dotted
+        paths of all fields to (node, key, owned), and leaves is a list of
+        (dotted path, parts, node, key) of all leaves in order.  owned is
+        False for fields under borrowed subtrees."""
+        cached = self._index
+        stamp = self._stamps[1]
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        index = ({}, [])
+        _index_node(self, '', (), index)
+        object.__setattr__(self, '_index', (stamp, index))
+        return index
+
+    def derive(self, overrides):
+        """Returns a variant of current dict with overrides applied, e.g.
+        `cfg.derive({'SOLVER.LR': 0.1})`.  Values are decoded and coerced in
+        the same way as merging from a yaml file.
+
+        Only the nodes on the paths to the overridden keys are copied, and
+        all other subtrees (and values, including numpy arrays) are shared
+        with current dict, so the cost is proportional to the size of the
+        overrides.  Both configs can still be assigned to independently: a
+        variant copies a shared subtree on first access (one level at a
+        time), and assigning to current dict first gives the variants still
+        sharing the modified subtree a copy of it.  Shared numpy arrays should
+        not be modified in place."""
+        return self._derive(_flatten_overrides(overrides))
+
+    def _derive(self, items, coerce=True):
+        """Implements `derive` for (dotted key, value) items.  If coerce is
+        False, the values should have been coerced already."""
+        from .configurator import _coerce_value, _decode_value
+        root = self._shallow_copy(link=False)
+        copied = {(): root}
+        for full_key, value in items:
+            path = tuple(full_key.split('.'))
+            node = root
+            for i, k in enumerate(path[:-1]):
+                child = copied.get(path[:i + 1])
+                if child is None:
+                    child = dict.get(node, k)
+                    if not isinstance(child, FrozenDict):
+                        raise KeyError('Non-existent config key: {}'.format(full_key))
+                    child = child._shallow_copy(link=False)
+                    _set(node, k, child)
+                    copied[path[:i + 1]] = child
+                node = child
+            k = path[-1]
+            if k not in node:
+                raise KeyError('Non-existent config key: {}'.format(full_key))
+            old = dict.__getitem__(node, k)
+            if isinstance(old, FrozenDict):
+                raise KeyError("Unable to reset FrozenDict at key '{0}'".format(full_key))
+            if coerce:
+                value = _coerce_value(_decode_value(value), old, full_key)
+            _set(node, k, value)
+        copied_ids = set(id(node) for node in copied.values())
+        for node in copied.values():
+            for k, v in dict.items(node):
+                if isinstance(v, FrozenDict) and id(v) not in copied_ids:
+                    _borrow(node, k, v)
+        return root
+
+    def _shallow_copy(self, link=True):
+        """Copy of current node sharing all values, which borrows the
+        subtrees borrowed by current node.  If link is False, the copy is not
+        recorded as a container of its values, which should be done by the
+        caller."""
+        out = self.__class__()
+        dict.update(out, self)
+        out.__dict__.update(self.__dict__)
+        if link:
+            borrowed = self._borrowed or ()
+            for k, v in dict.items(out):
+                if k in borrowed:
+                    _borrow(out, k, v)
+                else:
+                    _link(out, v)
+        object.__setattr__(out, '_frozen', self._frozen)
+        return out
+
+    def _mark_readonly(self):
+        if self._readonly:
+            return  # the whole subtree has been marked
+        object.__setattr__(self, '_readonly', True)
         for v in self.values():
             if isinstance(v, FrozenDict):
-                v.freeze(set_freeze)
+                v._mark_readonly()
+
+
+def _init_slots(fd):
+    object.__setattr__(fd, '_frozen', False)
+    object.__setattr__(fd, '_readonly', False)
+    object.__setattr__(fd, '_hash', None)
+    object.__setattr__(fd, '_pending', None)
+    object.__setattr__(fd, '_parents', None)
+    object.__setattr__(fd, '_variants', None)
+    object.__setattr__(fd, '_borrowed', None)
+    # stamps of the last assignment to fd or its descendants, and of the
+    # last one adding or removing keys, in a list so that _touch need not
+    # go through object.__setattr__
+    object.__setattr__(fd, '_stamps', [0, 0])
+    object.__setattr__(fd, '_index', None)
+    object.__setattr__(fd, '_flat', None)
+
+
+def _set(fd, name, value, link=True):
+    """Sets a field without checking, mirroring it as an attribute if its
+    name does not clash with attributes of the class."""
+    dict.__setitem__(fd, name, value)
+    if isinstance(name, str) and not _is_reserved(type(fd), name):
+        fd.__dict__[name] = value
+    if link:
+        _link(fd, value)
+
+
+def _link(parent, value):
+    """Records parent as a container of value and of FrozenDicts in value if
+    it is a list or tuple, so that assigning to them invalidates the caches
+    of parent."""
+    if isinstance(value, FrozenDict):
+        parents = value._parents
+        if parents is None:
+            object.__setattr__(value, '_parents', [weakref.ref(parent)])
+        elif not any(ref() is parent for ref in parents):
+            parents[:] = [ref for ref in parents if ref() is not None]
+            parents.append(weakref.ref(parent))
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _link(parent, item)
+
+
+def _unlink(parent, child):
+    """Reverts _link after child is removed from parent."""
+    parents = child._parents
+    if parents is not None and not any(v is child for v in dict.values(parent)):
+        parents[:] = [ref for ref in parents
+                      if ref() is not None and ref() is not parent]
+
+
+def _touch(fd, structure=False):
+    """Marks fd and all its ancestors as modified, which invalidates their
+    cached content hashes and flattened views, and also their path indices
+    if structure is True.  Should be called before modifying fd, since
+    variants sharing fd or its ancestors are given copies of them."""
+    _TICK[0] += 1
+    shared = []
+    _stamp(fd, _TICK[0], structure, shared)
+    for node in shared:
+        _detach(node)
+
+
+def _stamp(node, tick, structure, shared):
+    """Implements _touch, following the first parent in a loop.  Nodes with
+    variants are appended to shared unless it is None."""
+    while node is not None:
+        stamps = node._stamps
+        if stamps[0] == tick:
+            return  # reached by another path, or a cycle
+        stamps[0] = tick
+        if structure:
+            stamps[1] = tick
+        if node._variants and shared is not None:
+            shared.append(node)
+        parents = node._parents
+        if not parents:
+            return
+        if len(parents) > 1:
+            for ref in parents[1:]:
+                _stamp(ref(), tick, structure, shared)
+        node = parents[0]()
+
+
+def _add_variant(child, node, name):
+    """Records that node of a derived config shares child as field name."""
+    variants = child._variants
+    if variants is None:
+        variants = []
+        object.__setattr__(child, '_variants', variants)
+    elif len(variants) >= 16 and len(variants) & (len(variants) - 1) == 0:
+        # drop variants which are gone, at doubling sizes
+        variants[:] = [(ref, k) for ref, k in variants if ref() is not None]
+    variants.append((weakref.ref(node), name))
+
+
+def _borrow(node, name, child):
+    """Sets child, a subtree of another config, as field name of node, which
+    is copied on first access."""
+    dict.__setitem__(node, name, child)
+    node.__dict__.pop(name, None)
+    if node._borrowed is None:
+        object.__setattr__(node, '_borrowed', set())
+    node._borrowed.add(name)
+    _add_variant(child, node, name)
+
+
+def _adopt(node, name):
+    """Replaces the subtree borrowed by node at name by a copy owned by node,
+    which borrows the children of the subtree in turn, and returns it."""
+    child = dict.__getitem__(node, name)
+    copied = child.__class__()
+    for k, v in dict.items(child):
+        if isinstance(v, FrozenDict):
+            _borrow(copied, k, v)
+        else:
+            _set(copied, k, v)
+    object.__setattr__(copied, '_frozen', node._frozen)
+    node._borrowed.discard(name)
+    _set(node, name, copied)
+    # the content is unchanged, but path indices refer to child
+    _TICK[0] += 1
+    _stamp(node, _TICK[0], True, None)
+    return copied
+
+
+def _detach(child):
+    """Replaces child by a copy of it in all variants borrowing it, so that
+    child can be modified without affecting them.  The copy is borrowed by
+    those variants in turn."""
+    variants = child._variants
+    object.__setattr__(child, '_variants', None)
+    copied = None
+    for ref, name in variants:
+        node = ref()
+        if node is None or dict.get(node, name) is not child:
+            continue  # gone, or replaced since
+        if copied is None:
+            copied = _snapshot(child)
+        _borrow(node, name, copied)
+        # the content is unchanged, but path indices refer to child
+        _TICK[0] += 1
+        _stamp(node, _TICK[0], True, None)
+
+
+def _snapshot(v):
+    """Copies the FrozenDicts in v, sharing all other values."""
+    if isinstance(v, FrozenDict):
+        out = v.__class__()
+        for k, item in dict.items(v):
+            _set(out, k, _snapshot(item))
+        object.__setattr__(out, '_frozen', v._frozen)
+        return out
+    elif isinstance(v, (list, tuple)):
+        items = [_snapshot(item) for item in v]
+        if any(a is not b for a, b in zip(items, v)):
+            return type(v)(items)
+    return v
+
+
+_RESERVED = {}  # class -> names of its attributes
+
+
+def _is_reserved(cls, name):
+    names = _RESERVED.get(cls)
+    if names is None:
+        names = _RESERVED[cls] = frozenset(dir(cls))
+    return name in names
+
+
+def _index_node(node, prefix, parts, index, owned=True):
+    paths, leaves = index
+    borrowed = node._borrowed or ()
+    for k, v in dict.items(node):
+        k_str = k if isinstance(k, str) else str(k)
+        full_key = prefix + k_str
+        paths[full_key] = (node, k, owned)
+        if isinstance(v, FrozenDict):
+            _index_node(v, full_key + '.', parts + (k_str,), index,
+                        owned and k not in borrowed)
+        else:
+            leaves.append((full_key, parts + (k_str,), node, k))
+
+
+def _hook(v):
+    """Converts dicts (possibly inside lists and tuples) to FrozenDict."""
+    if isinstance(v, dict) and not isinstance(v, FrozenDict):
+        return FrozenDict(v)
+    elif isinstance(v, (list, tuple)):
+        return type(v)(_hook(item) for item in v)
+    return v
+
+
+def _rebuild(cls, items, frozen):
+    """Unpickles a FrozenDict."""
+    fd = cls.__new__(cls)
+    _init_slots(fd)
+    for k, v in items.items():
+        _set(fd, k, v)
+    object.__setattr__(fd, '_frozen', frozen)
+    return fd
+
+
+def _hash_value(h, v):
+    """Feeds a type-tagged serialization of v into hash h."""
+    h.update(type(v).__name__.encode('utf-8'))
+    if isinstance(v, FrozenDict):
+        # reuse the cached digest of subtrees
+        h.update(v.content_hash().encode('ascii'))
+    elif isinstance(v, dict):
+        _hash_items(h, v)
+    elif isinstance(v, (list, tuple)):
+        h.update('[{}'.format(len(v)).encode('utf-8'))
+        for item in v:
+            _hash_value(h, item)
+        h.update(b']')
+    elif isinstance(v, (np.ndarray, np.generic)):
+        v = np.asarray(v)
+        h.update('{0}{1}'.format(v.dtype.str, v.shape).encode('utf-8'))
+        h.update(np.ascontiguousarray(v).tobytes())
+    else:
+        h.update(repr(v).encode('utf-8'))
+    h.update(b';')
+
+
+def _hash_items(h, d):
+    h.update(b'{')
+    for k in sorted(d.keys(), key=repr):
+        _hash_value(h, k)
+        _hash_value(h, dict.__getitem__(d, k))
+    h.update(b'}')
+
+
+def _flatten_overrides(overrides, prefix=''):
+    """Yields (dotted key, value) from possibly nested dict of overrides."""
+    for k, v in overrides.items():
+        if isinstance(v, dict) and not isinstance(v, FrozenDict):
+            for item in _flatten_overrides(v, prefix + k + '.'):
+                yield item
+        else:
+            yield prefix + k, v
 
 
 def to_plain_dict(frozen_dict, sep=None):
@@ -60,17 +631,7 @@ def to_plain_dict(frozen_dict, sep=None):
     assert isinstance(frozen_dict, FrozenDict)
     if sep is None:
         sep = '__'
-    out = dict()
-    for k, v in frozen_dict.items():
-        if isinstance(v, FrozenDict):
-            # recursively get the dict and join
-            vdict = to_plain_dict(v, sep=sep)
-            for kk, vv in vdict.items():
-                out.update({sep.join([k, kk]): vv})
-        else:
-            out[k] = v
-
-    return out
+    return frozen_dict.flatten(sep)
 
 
 def from_plain_dict(plain_dict, sep=None):
@@ -85,12 +646,12 @@ def from_plain_dict(plain_dict, sep=None):
     for k, v in plain_dict.items():
         all_keys = k.split(sep)
         current = frozen_dict
-        for ak in all_keys:
-            if ak == all_keys[-1]:  # the last one
-                current[ak] = v
-            else:
-                if not hasattr(current, ak):
-                    current[ak] = FrozenDict()
-                current = current[ak]
+        for ak in all_keys[:-1]:
+            child = dict.get(current, ak)
+            if child is None:
+                child = current[ak] = FrozenDict()
+            current = child
+        current[all_keys[-1]] = v
+    frozen_dict._path_index()  # index once for later lookups
 
     return frozen_dict
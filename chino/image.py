@@ -1,13 +1,21 @@
 """Utilities for loading an image from path, with given options."""
+import hashlib
 import logging
 import os
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
 import numpy as np
 import cv2
+from .io.fileio import atomic_open
 
 logger = logging.getLogger(__name__)
 
 
-def imread(filename, dtype=np.float32, scaled=True, gray=False, dsize=None):
+def imread(filename, dtype=np.float32, scaled=True, gray=False, dsize=None,
+           cache=None, out=None, reduced_decode=False):
     """Load image from filename.
 
     Parameters
@@ -24,6 +32,17 @@ def imread(filename, dtype=np.float32, scaled=True, gray=False, dsize=None):
         If True, then the image is converted to single channel grayscale image.
     dsize: tuple or None
         If not None, then the image is rescaled to this shape.
+    cache: ImageCache or None
+        If not None, the decoded image is looked up in and stored to the
+        cache.  Images returned from a cache are read-only.
+    out: ndarray or None
+        If not None, the image is written into this array, which should have
+        the shape of the loaded image and the given dtype.
+    reduced_decode: boolean
+        If True and dsize is much smaller than a JPEG image, then the image is
+        decoded at 1/2, 1/4 or 1/8 resolution before resizing, which is much
+        faster but gives slightly different pixel values, hence is disabled
+        by default.
 
     Returns
     -------
@@ -32,19 +51,362 @@ def imread(filename, dtype=np.float32, scaled=True, gray=False, dsize=None):
         image, then the color channel is organized in RGB order.  If it is a
         grayscale image, then img is two dimensional.
     """
+    if cache is not None:
+        key = cache.key(filename, dtype, scaled, gray, dsize, reduced_decode)
+        image = cache.get(key)
+        if image is not None:
+            if out is None:
+                return image
+            _check_out(out, image.shape, dtype)
+            out[...] = image
+            return out
+    image = _decode(filename, gray, dsize, reduced_decode)
+    owned = out is None
+    if owned:
+        out = np.empty(image.shape, dtype=dtype)
+    else:
+        _check_out(out, image.shape, dtype)
+    # the only full-size copy besides decoding, which also does the casting
+    out[...] = image
+    if scaled:
+        if np.issubdtype(out.dtype, np.integer):
+            logger.warning('Image type is %s, so is not scaled', out.dtype)
+        else:
+            out /= 255.
+    if cache is not None:
+        cache.put(key, out if owned else out.copy())
+    return out
+
+
+def imread_batch(filenames, dtype=np.float32, scaled=True, gray=False,
+                 dsize=None, workers=None, out=None, cache=None,
+                 reduced_decode=False):
+    """Load a batch of images into one preallocated array.
+
+    Images are decoded on a thread pool (cv2 releases the GIL while decoding)
+    and written directly into their slot of the output array, so no per-image
+    arrays need to be stacked afterwards.
+
+    Parameters
+    ----------
+    filenames: sequence of strings
+        File paths for the images.
+    dtype, scaled, gray, dsize, cache, reduced_decode:
+        Same as `imread`.  All images must have the same shape after loading,
+        which is guaranteed if `dsize` is given.
+    workers: int or None
+        Number of decoding threads.  If None, the default of
+        `concurrent.futures.ThreadPoolExecutor` is used.
+    out: ndarray or None
+        If not None, the images are written into this array, which should
+        have shape [N, H, W] or [N, H, W, C] and the given dtype.
+
+    Returns
+    -------
+    out: ndarray [N, H, W] (for grayscale images) or [N, H, W, C] (for color
+        images)
+        Images stacked along the first dimension, each laid out as returned
+        by `imread`.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return _imread_batch(executor, filenames, dtype, scaled, gray, dsize,
+                             out, cache, reduced_decode)
+
+
+def iter_images(filenames, batch_size, prefetch=2, workers=None,
+                drop_last=False, **kwargs):
+    """Iterate over batches of images, which are loaded in background.
+
+    A background thread loads the batches in order by `imread_batch` on
+    `workers` threads, and keeps at most `prefetch` ready batches in a
+    bounded queue, so that loading overlaps with the consumer while memory
+    stays capped.  Exceptions raised when loading are re-raised to the
+    consumer.  Closing the generator (or breaking out of the loop) stops the
+    background thread.
+
+    Parameters
+    ----------
+    filenames: sequence of strings
+        File paths for the images.
+    batch_size: int
+        Number of images per batch.  The last batch may be smaller unless
+        drop_last is True.
+    prefetch: int
+        Maximum number of batches loaded ahead of the consumer.
+    workers: int or None
+        Number of decoding threads, same as `imread_batch`.
+    kwargs:
+        Passed to `imread_batch`, except for `out`.
+
+    Yields
+    ------
+    batch: ndarray [N, H, W] or [N, H, W, C]
+        Same as returned by `imread_batch`.
+    """
+    filenames = list(filenames)
+    batches = [filenames[i:i + batch_size]
+               for i in range(0, len(filenames), batch_size)]
+    if drop_last and len(batches) > 0 and len(batches[-1]) < batch_size:
+        batches.pop()
+    queue = Queue(maxsize=max(prefetch, 1))
+    stop = threading.Event()
+
+    def _put(item):
+        # wake up regularly, so that the producer exits once stopped
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _produce():
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for batch in batches:
+                    out = _imread_batch(executor, batch, **kwargs)
+                    if not _put((out, None)):
+                        return
+            except BaseException as e:
+                _put((None, e))
+                return
+        _put((None, None))
+
+    thread = threading.Thread(target=_produce, name='iter_images', daemon=True)
+    thread.start()
+    try:
+        while True:
+            out, error = queue.get()
+            if error is not None:
+                raise error
+            if out is None:
+                return
+            yield out
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _imread_batch(executor, filenames, dtype=np.float32, scaled=True,
+                  gray=False, dsize=None, out=None, cache=None,
+                  reduced_decode=False):
+    """Implements `imread_batch` on a given executor."""
+    filenames = list(filenames)
+    if len(filenames) == 0:
+        raise ValueError('Empty list of filenames.')
+
+    def _read(filename):
+        """Returns the image, whether it is freshly decoded (i.e. not loaded
+        from cache), and its cache key."""
+        key = None
+        if cache is not None:
+            key = cache.key(filename, dtype, scaled, gray, dsize,
+                            reduced_decode)
+            image = cache.get(key)
+            if image is not None:
+                return image, False, None
+        return _decode(filename, gray, dsize, reduced_decode), True, key
+
+    # The first image determines the shape of the batch.
+    first = _read(filenames[0])
+    shape = (len(filenames),) + first[0].shape
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    else:
+        _check_out(out, shape, dtype)
+    do_scale = scaled and not np.issubdtype(out.dtype, np.integer)
+    if scaled and not do_scale:
+        logger.warning('Image type is %s, so is not scaled', out.dtype)
+
+    def _load(i):
+        image, decoded, key = first if i == 0 else _read(filenames[i])
+        if image.shape != out.shape[1:]:
+            raise ValueError('Image {} has shape {}, expected {}'.format(
+                filenames[i], image.shape, out.shape[1:]))
+        out[i] = image
+        if decoded and do_scale:
+            out[i] /= 255.
+        if key is not None:
+            cache.put(key, out[i].copy())
+
+    # consume the iterator so that exceptions are raised here
+    list(executor.map(_load, range(len(filenames))))
+    return out
+
+
+def _check_out(out, shape, dtype):
+    if out.shape != shape or out.dtype != np.dtype(dtype):
+        raise ValueError('Output array of shape {} and dtype {} is expected, '
+                         'got {} and {}'.format(shape, np.dtype(dtype),
+                                                out.shape, out.dtype))
+
+
+_REDUCED_FLAGS = {
+    # (gray, factor) -> flag
+    (True, 1): cv2.IMREAD_GRAYSCALE,
+    (True, 2): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (True, 4): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (True, 8): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    (False, 1): cv2.IMREAD_COLOR,
+    (False, 2): cv2.IMREAD_REDUCED_COLOR_2,
+    (False, 4): cv2.IMREAD_REDUCED_COLOR_4,
+    (False, 8): cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _decode(filename, gray, dsize, reduced_decode=False):
+    """Decode an image to uint8 (RGB or grayscale) and resize it."""
     assert os.path.exists(filename), \
         'Path does not exist: {}'.format(filename)
-    if gray:
-        image = cv2.imread(filename, cv2.IMREAD_GRAYSCALE)
-    else:
-        image = cv2.imread(filename, cv2.IMREAD_COLOR)
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    factor = 1
+    if dsize is not None and reduced_decode:
+        size = _jpeg_size(filename)
+        if size is not None:
+            # Use the shorter side against the longer target side, so that
+            # the image is never upsampled even if it is rotated by EXIF.
+            short, target = min(size), max(dsize)
+            for f in (8, 4, 2):
+                if short // f >= target:
+                    factor = f
+                    break
+    image = cv2.imread(filename, _REDUCED_FLAGS[(bool(gray), factor)])
+    if image is None:
+        raise IOError('Unable to decode image: {}'.format(filename))
     if dsize is not None:
+        # resizing first converts less pixels for downsampling
         image = cv2.resize(image, dsize=dsize)
-    image = image.astype(dtype)
-    if scaled:
-        if np.issubdtype(image.dtype, np.integer):
-            logger.warning('Image type is %s, so is not scaled', image.dtype)
-        else:
-            image /= 255.
+    if not gray:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
     return image
+
+
+def _jpeg_size(filename):
+    """Returns (width, height) read from the header of a JPEG file, or None if
+    it is not a JPEG file."""
+    with open(filename, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            return None
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            m = marker[1]
+            while m == 0xFF:  # fill bytes
+                m = ord(f.read(1) or b'\x00')
+            if m == 0x01 or 0xD0 <= m <= 0xD8:  # markers without length
+                continue
+            length = f.read(2)
+            if len(length) < 2:
+                return None
+            # SOFn except DHT, JPG and DAC
+            if 0xC0 <= m <= 0xCF and m not in (0xC4, 0xC8, 0xCC):
+                header = f.read(5)
+                if len(header) < 5:
+                    return None
+                _, height, width = struct.unpack('>BHH', header)
+                return width, height
+            f.seek(struct.unpack('>H', length)[0] - 2, os.SEEK_CUR)
+
+
+class ImageCache(object):
+    """LRU cache of decoded images under a memory budget of `max_bytes`.
+
+    Entries are keyed by path, mtime, size and the loading options, so
+    modified files are never served from cache.  If `cache_dir` is not None,
+    decoded images are also stored there as `.npy` files, which are
+    memory-mapped when read back.  The on-disk tier is not bounded.
+
+    Cached arrays are shared between callers and thus set to read-only.
+    Counters `hits`, `disk_hits`, `misses` and `evictions` are available to
+    tune the budget.  The cache is thread-safe.
+    """
+
+    def __init__(self, max_bytes=1 << 30, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(filename, dtype, scaled, gray, dsize, reduced_decode=False):
+        """Cache key for an image loaded with given options."""
+        st = os.stat(filename)
+        return (os.path.abspath(filename), st.st_mtime_ns, st.st_size,
+                np.dtype(dtype).str, bool(scaled), bool(gray),
+                None if dsize is None else tuple(dsize), bool(reduced_decode))
+
+    def get(self, key):
+        """Returns the cached image for key, or None if it is not cached."""
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image
+        if self.cache_dir is not None:
+            try:
+                image = np.load(self._disk_path(key), mmap_mode='r')
+            except (IOError, ValueError):
+                image = None
+            if image is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._insert(key, image)
+                return image
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, image):
+        """Stores image for key.  The image is set to read-only."""
+        image.setflags(write=False)
+        if self.cache_dir is not None:
+            filename = self._disk_path(key)
+            try:
+                with atomic_open(filename) as f:
+                    np.save(f, image)
+            except OSError as e:
+                logger.warning('Unable to cache image to %s: %s', filename, e)
+        self._insert(key, image)
+
+    def clear(self):
+        """Drops all in-memory entries.  The on-disk tier is kept."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """Returns the counters as a dict."""
+        with self._lock:
+            return dict(hits=self.hits, disk_hits=self.disk_hits,
+                        misses=self.misses, evictions=self.evictions,
+                        entries=len(self._entries), nbytes=self.nbytes)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _insert(self, key, image):
+        if image.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._entries[key] = image
+            self.nbytes += image.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest + '.npy')
@@ -0,0 +1,153 @@
+"""Cache of parsed results for `chino.io.fileio.load`."""
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from chino.io.fileio import atomic_open
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_CACHE = None
+
+
+def default_cache() -> 'LoadCache':
+    """The cache used by `load(..., cache=True)`, stored under
+    $HOME/.chino/cache/load."""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = LoadCache()
+    return _DEFAULT_CACHE
+
+
+class LoadCache(object):
+    """
+    Stores parsed results as pickled sidecar files under `cache_dir`.
+
+    An entry is named by the path and load options of the file together with
+    a hash of its contents, so a modified file gets a new entry and older
+    entries of the same file are removed.  Least recently used entries are
+    removed once the total size exceeds `max_bytes`.  On top of the files,
+    the pickled results of the last `memo_size` files are kept in memory and
+    validated by size and mtime, so that they need not even be hashed again.
+    Every load returns a fresh copy of the result, except that results which
+    cannot be pickled are returned as loaded and not cached.
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = 1 << 30,
+                 memo_size: int = 64):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.chino', 'cache', 'load')
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.memo_size = memo_size
+        self.hits = 0
+        self.misses = 0
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, filename: str, loader: Callable, **kwargs):
+        """Returns the cached result of `loader(filename, **kwargs)`."""
+        path = os.path.abspath(filename)
+        options = repr(sorted(kwargs.items()))
+        st = os.stat(path)
+        memo_key = (path, options, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            blob = self._memo.get(memo_key)
+            if blob is not None:
+                self._memo.move_to_end(memo_key)
+                self.hits += 1
+        if blob is not None:
+            return pickle.loads(blob)
+
+        name = _hash(path.encode('utf-8'), options.encode('utf-8'))
+        entry = os.path.join(self.cache_dir, '{0}-{1}.pkl'.format(name, _file_hash(path)))
+        try:
+            with open(entry, 'rb') as f:
+                blob = f.read()
+            os.utime(entry)  # mark as recently used
+        except IOError:
+            blob = None
+        if blob is not None:
+            # entries may be truncated or refer to classes which have changed
+            try:
+                data = pickle.loads(blob)
+            except Exception as e:
+                logger.warning('Ignoring unreadable cache entry %s: %s', entry, e)
+                blob = None
+        with self._lock:
+            if blob is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if blob is None:
+            data = loader(filename, **kwargs)
+            try:
+                blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                logger.warning('Unable to cache result of %s: %s', filename, e)
+                return data
+            self._store(name, entry, blob)
+        with self._lock:
+            self._memo[memo_key] = blob
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return data
+
+    def clear(self):
+        """Removes all entries."""
+        with self._lock:
+            self._memo.clear()
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.pkl'):
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def _store(self, name, entry, blob):
+        try:
+            with atomic_open(entry, 'wb') as f:
+                f.write(blob)
+        except OSError as e:
+            logger.warning('Unable to write cache entry %s: %s', entry, e)
+            return
+        entries = []
+        for fname in os.listdir(self.cache_dir):
+            if not fname.endswith('.pkl'):
+                continue
+            fpath = os.path.join(self.cache_dir, fname)
+            try:
+                if fname.startswith(name + '-') and fpath != entry:
+                    os.remove(fpath)  # stale entry of the same file
+                    continue
+                st = os.stat(fpath)
+            except OSError:
+                continue  # removed concurrently
+            entries.append((st.st_mtime, st.st_size, fpath))
+        total = sum(size for _, size, _ in entries)
+        for _, size, fpath in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(fpath)
+            except OSError:
+                pass
+            total -= size
+
+
+def _hash(*parts: bytes) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part)
+    return h.hexdigest()
+
+
+def _file_hash(filename: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
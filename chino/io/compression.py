@@ -0,0 +1,50 @@
+"""Transparent decompression of files with stacked extensions such as
+`.tsv.gz`, `.list.zst` or `.json.xz`."""
+import io
+import os
+from typing import IO, Optional, Tuple
+
+COMPRESSIONS = ('.gz', '.bz2', '.xz', '.zst')
+
+
+def split_ext(filename: str) -> Tuple[str, Optional[str]]:
+    """
+    Returns the lowercase file extension and the compression extension (or
+    None for uncompressed files), e.g. ('.tsv', '.gz') for `a.tsv.gz`.
+    """
+    root, ext = os.path.splitext(filename)
+    ext = ext.lower()
+    if ext in COMPRESSIONS:
+        return os.path.splitext(root)[1].lower(), ext
+    return ext, None
+
+
+def open_file(filename: str, mode: str = 'r', encoding: str = None) -> IO:
+    """
+    Open a file for reading in text ('r') or binary ('rb') mode, which is
+    decompressed on the fly if it has a compression extension.  Memory use
+    does not grow with the decompressed size.  `.zst` files require the
+    zstandard package.
+    """
+    if mode not in ('r', 'rb'):
+        raise ValueError('Unsupported mode: {0}'.format(mode))
+    _, compression = split_ext(filename)
+    if compression is None:
+        return open(filename, mode, encoding=encoding)
+    if compression == '.gz':
+        import gzip
+        f = gzip.open(filename, 'rb')
+    elif compression == '.bz2':
+        import bz2
+        f = bz2.open(filename, 'rb')
+    elif compression == '.xz':
+        import lzma
+        f = lzma.open(filename, 'rb')
+    else:
+        import zstandard
+        raw = zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'),
+                                                          closefd=True)
+        f = io.BufferedReader(raw)
+    if mode == 'r':
+        return io.TextIOWrapper(f, encoding=encoding)
+    return f
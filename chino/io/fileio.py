@@ -1,7 +1,18 @@
 """IO for reading and writing files."""
+import io
+import mmap
 import os
-from typing import Sequence
+import pickle
+import struct
+import uuid
+from collections import deque, namedtuple
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Union
 
+from chino.io.compression import open_file, split_ext
 from chino.io.lineio import read_lines
 
 
@@ -26,21 +37,191 @@ def create_text_file(filename: str,
     os.chmod(filename, mode)
 
 
-def load(filename: str, **kwargs):
+@contextmanager
+def atomic_open(filename: str, mode: str = 'wb', **kwargs):
+    """
+    Open a temporary file next to filename for writing, which is renamed to
+    filename on success, so that readers never see a partially written file.
+    """
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    tmp = os.path.join(dirname, '.{0}.{1}.tmp'.format(basename, uuid.uuid4().hex))
+    # unlike mkstemp, the permission of the file respects umask
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp, filename)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def load(filename: str, cache=None, **kwargs):
     """Universal load function, depending on the filetype of filename.
-    The kwargs are dispatched to corresponding loader."""
+    The kwargs are dispatched to corresponding loader.
+
+    Text files, pickles and msgpack files may be compressed, which is
+    detected by stacked extensions such as `.tsv.gz`, `.list.zst` or
+    `.json.xz`, and decompressed while streaming.
+
+    If `cache` is True or a `chino.io.cache.LoadCache`, then the parsed result
+    is cached, and later loads of the unchanged file skip parsing.  Streaming
+    results are never cached, nor are the memory-mapped or lazily loaded
+    binary formats below, which need no parsing in the first place.
+
+    Binary formats: `.npy` files are memory-mapped read-only unless another
+    `mmap_mode` is given; `.npz` files are loaded lazily; `.pkl`/`.pickle`
+    files written with `save(..., out_of_band=True)` are memory-mapped, so
+    that arrays in them are read-only views without copying; `.msgpack`
+    requires the msgpack package.
+
+    For `.tsv` files, if `chunksize` is given, then an iterator over chunks
+    of at most `chunksize` rows is returned instead, which reads the file in
+    bounded memory.  Chunks are DataFrames, or lists of rows if
+    `as_plain_text` is True.  Plain text rows support `usecols` (a list of
+    column indices) and `dtype` (a callable, or a dict from column index to
+    callable) similar to pandas, so that unused columns are dropped as soon
+    as a line is split."""
     if not os.path.isfile(filename):
         raise FileNotFoundError('{0} does not exist.'.format(filename))
-    _, ext = os.path.splitext(filename)
-    ext = ext.lower()
+    if cache and kwargs.get('chunksize') is None and not _is_mapped(filename):
+        from chino.io.cache import LoadCache, default_cache
+        if not isinstance(cache, LoadCache):
+            cache = default_cache()
+        return cache.load(filename, _load, **kwargs)
+    return _load(filename, **kwargs)
+
+
+def _is_mapped(filename: str) -> bool:
+    """Whether `load` memory-maps or lazily loads filename."""
+    ext, compression = split_ext(filename)
+    if ext in ('.npy', '.npz'):
+        return True
+    if ext in ('.pkl', '.pickle') and compression is None:
+        with open(filename, 'rb') as f:
+            return f.read(len(_OOB_MAGIC)) == _OOB_MAGIC
+    return False
+
+
+def load_array(filename: str, key: str = None, mmap_mode: str = 'r') -> Any:
+    """Loads an array from a `.npy` file, or the member key of a `.npz` file
+    (which may be omitted if there is only one), memory-mapped with
+    mmap_mode.  Members of `.npz` files are memory-mapped as well if they are
+    stored without compression, as by `np.savez`, and loaded otherwise."""
+    import numpy as np
+    ext, _ = split_ext(filename)
+    if ext == '.npy':
+        return np.load(filename, mmap_mode=mmap_mode)
+    if ext != '.npz':
+        raise ValueError('Unsupported array file type: {0}'.format(filename))
+    import zipfile
+    with zipfile.ZipFile(filename) as zf:
+        names = [name[:-4] for name in zf.namelist() if name.endswith('.npy')]
+        if key is None:
+            if len(names) != 1:
+                raise KeyError('Member key is required for {0} with arrays '
+                               '{1}'.format(filename, names))
+            key = names[0]
+        elif key not in names:
+            raise KeyError('{0} is not a member of {1}'.format(key, filename))
+        info = zf.getinfo(key + '.npy')
+    if mmap_mode is not None and info.compress_type == zipfile.ZIP_STORED:
+        with open(filename, 'rb') as f:
+            # skip the local file header, whose extra field may differ from
+            # the one in the central directory
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack('<HH', f.read(4))
+            f.seek(name_len + extra_len, os.SEEK_CUR)
+            version = np.lib.format.read_magic(f)
+            if version in ((1, 0), (2, 0)):
+                read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) \
+                    else np.lib.format.read_array_header_2_0
+                shape, fortran_order, dtype = read_header(f)
+                offset = f.tell()
+            else:
+                shape, dtype = None, None
+        if dtype is not None and not dtype.hasobject and int(np.prod(shape)) > 0:
+            return np.memmap(filename, dtype=dtype, mode=mmap_mode, offset=offset,
+                             shape=shape, order='F' if fortran_order else 'C')
+    with np.load(filename) as data:
+        return data[key]
+
+
+LoadResult = namedtuple('LoadResult', ['filename', 'data', 'error'])
+
+
+def load_many(filenames: Iterable[str],
+              executor: str = 'thread',
+              workers: int = None,
+              ordered: bool = True,
+              **kwargs) -> Iterator[LoadResult]:
+    """
+    Load many files in parallel by `load` with kwargs, and iterate over
+    `LoadResult(filename, data, error)`.  Loading does not abort on errors;
+    instead the exception is returned in `error` and `data` is None.
+
+    The executor is either 'thread', which suits I/O and loaders releasing
+    the GIL such as image decoding, or 'process', which scales pure Python
+    parsers such as YAML with cores.  If ordered is True, results are
+    returned in the order of filenames, otherwise as soon as they finish.
+    At most a few tasks per worker are in flight, so filenames may be a
+    lazy iterable.
+    """
+    if executor == 'thread':
+        pool_cls = ThreadPoolExecutor
+    elif executor == 'process':
+        pool_cls = ProcessPoolExecutor
+    else:
+        raise ValueError('Unknown executor: {0}'.format(executor))
+    max_in_flight = 4 * (workers or os.cpu_count() or 1)
+    filenames = iter(filenames)
+    with pool_cls(max_workers=workers) as pool:
+        pending = deque()
+
+        def _submit():
+            for filename in islice(filenames, max_in_flight - len(pending)):
+                pending.append((filename, pool.submit(_load_safely, filename, kwargs)))
+
+        def _result(filename, future):
+            try:
+                data, error = future.result()
+            except Exception as e:  # e.g. the worker process died
+                data, error = None, e
+            return LoadResult(filename, data, error)
+
+        _submit()
+        while len(pending) > 0:
+            if ordered:
+                yield _result(*pending.popleft())
+            else:
+                wait([future for _, future in pending], return_when=FIRST_COMPLETED)
+                for item in [item for item in pending if item[1].done()]:
+                    pending.remove(item)
+                    yield _result(*item)
+            _submit()
+
+
+def _load_safely(filename: str, kwargs: Dict):
+    try:
+        return load(filename, **kwargs), None
+    except Exception as e:
+        return None, e
+
+
+def _load(filename: str, **kwargs):
+    ext, compression = split_ext(filename)
+    if compression is not None and ext in ('.jpg', '.jpeg', '.png', '.npy', '.npz'):
+        raise ValueError('Compressed {0} files are not supported.'.format(ext))
     if ext == '.json':
         import json
-        with open(filename, 'r') as f:
+        with open_file(filename, 'r') as f:
             data = json.load(f)
     elif ext in ('.yml', '.yaml'):
         import yaml
-        with open(filename, 'r') as f:
-            data = yaml.load(f)
+        # the libyaml based loader is much faster if available
+        loader = getattr(yaml, 'CFullLoader', yaml.FullLoader)
+        with open_file(filename, 'r') as f:
+            data = yaml.load(f, Loader=loader)
     elif ext in ('.jpg', '.jpeg', '.png'):
         import cv2
         data = cv2.imread(filename)
@@ -51,13 +232,209 @@ def load(filename: str, **kwargs):
             as_plain_text = kwargs.pop('as_plain_text')
         else:
             as_plain_text = False
+        chunksize = kwargs.pop('chunksize', None)
         if as_plain_text:
-            lines = read_lines(filename)
-            data = [line.split('\t') for line in lines]
+            rows = _iter_tsv_rows(filename, **kwargs)
+            if chunksize is None:
+                data = list(rows)
+            else:
+                data = _iter_chunks(rows, chunksize)
         else:
             import pandas as pd
-            defaults = {'sep': '\t', 'header': None}
+            defaults = {'sep': '\t', 'header': None, 'chunksize': chunksize}
             defaults.update(kwargs)
             data = pd.read_csv(filename, **defaults)
+    elif ext == '.npy':
+        import numpy as np
+        defaults = {'mmap_mode': 'r'}
+        defaults.update(kwargs)
+        data = np.load(filename, **defaults)
+    elif ext == '.npz':
+        import numpy as np
+        data = np.load(filename, **kwargs)
+    elif ext in ('.pkl', '.pickle') and compression is None:
+        with open(filename, 'rb') as f:
+            if f.read(len(_OOB_MAGIC)) == _OOB_MAGIC:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                data = _unpack_oob(buf)
+            else:
+                f.seek(0)
+                data = pickle.load(f, **kwargs)
+    elif ext in ('.pkl', '.pickle'):
+        with open_file(filename, 'rb') as f:
+            data = f.read()
+        if data.startswith(_OOB_MAGIC):
+            data = _unpack_oob(data)
+        else:
+            data = pickle.loads(data, **kwargs)
+    elif ext == '.msgpack':
+        import msgpack
+        defaults = {'raw': False}
+        defaults.update(kwargs)
+        with open_file(filename, 'rb') as f:
+            data = msgpack.unpackb(f.read(), **defaults)
+    else:
+        raise ValueError('Unsupported file type: {0}'.format(filename))
     return data
 
+
+def save(filename: str, obj: Any, create_dir: bool = False, **kwargs) -> None:
+    """Universal save function, the counterpart of `load`, depending on the
+    filetype of filename.  The kwargs are dispatched to corresponding writer.
+    Files are written atomically, i.e. concurrent readers see either the old
+    or the new file but never a partial one.
+
+    For `.npz` files, obj should be a dict of arrays, which are compressed if
+    `compressed` is True.  For `.pkl`/`.pickle` files, pickle protocol 5 is
+    used; if `out_of_band` is True, then buffers of arrays are stored
+    separately and aligned, so that `load` maps them without copying."""
+    dirname = os.path.dirname(filename)
+    if create_dir and len(dirname) > 0 and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    _, ext = os.path.splitext(filename)
+    ext = ext.lower()
+    if ext == '.json':
+        import json
+        with atomic_open(filename, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, **kwargs)
+    elif ext in ('.yml', '.yaml'):
+        import yaml
+        defaults = {'default_flow_style': False}
+        defaults.update(kwargs)
+        with atomic_open(filename, 'w', encoding='utf-8') as f:
+            yaml.dump(obj, f, **defaults)
+    elif ext in ('.jpg', '.jpeg', '.png'):
+        import cv2
+        success, encoded = cv2.imencode(ext, obj, **kwargs)
+        if not success:
+            raise IOError('Unable to encode image to {0}'.format(filename))
+        with atomic_open(filename, 'wb') as f:
+            f.write(encoded)
+    elif ext == '.list':
+        with atomic_open(filename, 'w', encoding='utf-8') as f:
+            for line in obj:
+                f.write(line + '\n')
+    elif ext == '.tsv':
+        with atomic_open(filename, 'w', encoding='utf-8') as f:
+            if hasattr(obj, 'to_csv'):
+                defaults = {'sep': '\t', 'header': False, 'index': False}
+                defaults.update(kwargs)
+                obj.to_csv(f, **defaults)
+            else:
+                for row in obj:
+                    f.write('\t'.join(str(v) for v in row) + '\n')
+    elif ext == '.npy':
+        import numpy as np
+        with atomic_open(filename, 'wb') as f:
+            np.save(f, obj, **kwargs)
+    elif ext == '.npz':
+        import numpy as np
+        savez = np.savez_compressed if kwargs.pop('compressed', False) else np.savez
+        with atomic_open(filename, 'wb') as f:
+            savez(f, **obj)
+    elif ext in ('.pkl', '.pickle'):
+        with atomic_open(filename, 'wb') as f:
+            if kwargs.pop('out_of_band', False):
+                chunks, _ = _pack_oob(obj)
+                for offset, chunk in chunks:
+                    f.seek(offset)
+                    f.write(chunk)
+            else:
+                pickle.dump(obj, f, protocol=5, **kwargs)
+    elif ext == '.msgpack':
+        import msgpack
+        defaults = {'use_bin_type': True}
+        defaults.update(kwargs)
+        with atomic_open(filename, 'wb') as f:
+            f.write(msgpack.packb(obj, **defaults))
+    else:
+        raise ValueError('Unsupported file type: {0}'.format(filename))
+
+
+# Layout of pickles with out-of-band buffers: magic, the size of the pickle
+# stream and number of buffers, offset and size of each buffer, the pickle
+# stream, and the buffers aligned to _OOB_ALIGNMENT bytes.
+_OOB_MAGIC = b'CHINOPK5'
+_OOB_ALIGNMENT = 64
+
+
+def _pack_oob(obj):
+    """Returns chunks of (offset, bytes-like) of obj pickled with out-of-band
+    buffers, and the total size."""
+    buffers = []
+    f = io.BytesIO()
+    _OOBPickler(f, protocol=5, buffer_callback=buffers.append).dump(obj)
+    stream = f.getbuffer()
+    raws = [b.raw() for b in buffers]
+    offset = len(_OOB_MAGIC) + 16 + 16 * len(raws) + len(stream)
+    layout = []
+    for raw in raws:
+        offset += -offset % _OOB_ALIGNMENT
+        layout.append((offset, raw.nbytes))
+        offset += raw.nbytes
+    header = _OOB_MAGIC + struct.pack('<QQ', len(stream), len(raws)) + \
+        b''.join(struct.pack('<QQ', *item) for item in layout)
+    chunks = [(0, header), (len(header), stream)]
+    chunks.extend((o, raw) for (o, _), raw in zip(layout, raws))
+    return chunks, offset
+
+
+class _OOBPickler(pickle.Pickler):
+
+    def reducer_override(self, obj):
+        # numpy pickles subclasses such as memmaps in-band, so pickle them as
+        # plain arrays instead of copying their data into the stream
+        if type(obj).__name__ == 'memmap':
+            import numpy as np
+            if isinstance(obj, np.memmap):
+                return np.asarray(obj).__reduce_ex__(5)
+        return NotImplemented
+
+
+def _unpack_oob(buf):
+    """Unpickles obj from a buffer laid out by `_pack_oob`.  Arrays in obj
+    are views into buf."""
+    view = memoryview(buf)
+    start = len(_OOB_MAGIC)
+    stream_size, num_buffers = struct.unpack_from('<QQ', view, start)
+    start += 16
+    buffers = []
+    for _ in range(num_buffers):
+        offset, nbytes = struct.unpack_from('<QQ', view, start)
+        buffers.append(view[offset:offset + nbytes])
+        start += 16
+    return pickle.loads(view[start:start + stream_size], buffers=buffers)
+
+
+def _iter_tsv_rows(filename: str,
+                   usecols: Sequence[int] = None,
+                   dtype: Union[Callable, Dict[int, Callable]] = None) -> Iterator[List]:
+    """Iterate over split rows of a tsv file, keeping only columns in
+    usecols and converting them by dtype.  Only the line terminator is
+    stripped, so that empty leading and trailing fields are kept; blank
+    lines are skipped, as pandas does."""
+    with open_file(filename, 'r') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            row = line.split('\t')
+            if usecols is not None:
+                row = [row[c] for c in usecols]
+            if dtype is not None:
+                cols = range(len(row)) if usecols is None else usecols
+                if callable(dtype):
+                    row = [dtype(v) for v in row]
+                else:
+                    row = [dtype[c](v) if c in dtype else v for c, v in zip(cols, row)]
+            yield row
+
+
+def _iter_chunks(iterable, chunksize: int) -> Iterator[List]:
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, chunksize))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
@@ -1,8 +1,116 @@
 """Utilities for parsing lines."""
-from typing import Sequence
+import logging
+import mmap
+import os
+from typing import Iterator, Sequence
+
+import numpy as np
+
+from chino.io.compression import open_file, split_ext
+
+logger = logging.getLogger(__name__)
 
 
 def read_lines(filename: str) -> Sequence[str]:
-    with open(filename, 'r') as f:
-        lines = [line.strip() for line in f.readlines()]
+    with open_file(filename, 'r') as f:
+        lines = [line.strip() for line in f]
         return lines
+
+
+def iter_lines(filename: str) -> Iterator[str]:
+    """Iterate over stripped lines of a file in constant memory.  Compressed
+    files are decompressed on the fly."""
+    with open_file(filename, 'r') as f:
+        for line in f:
+            yield line.strip()
+
+
+class LineIndex(object):
+    """
+    Random access to stripped lines of a text file without loading it.
+    The file is memory-mapped and the offsets of all lines are computed once
+    and cached in a sidecar file (`filename + '.lineidx.npy'` by default),
+    which is rebuilt whenever the mtime or size of the file changes.
+    Compressed files are not supported, since they cannot be memory-mapped.
+    """
+
+    CHUNK_SIZE = 1 << 24
+
+    def __init__(self, filename: str, index_file: str = None):
+        if split_ext(filename)[1] is not None:
+            raise ValueError('Unable to index compressed file: {0}'.format(filename))
+        self.filename = filename
+        if index_file is None:
+            index_file = filename + '.lineidx.npy'
+        self.index_file = index_file
+        st = os.stat(filename)
+        self._offsets = self._load_index(st)
+        if self._offsets is None:
+            self._offsets = self._build_index(st)
+        self._f = open(filename, 'rb')
+        # mmap does not accept empty files
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) \
+            if st.st_size > 0 else b''
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('Line index out of range: {}'.format(i))
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return self._mm[start:end].decode('utf-8').strip()
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _load_index(self, st):
+        """Loads the sidecar index, which starts with mtime and size of the
+        indexed file, followed by the line offsets."""
+        try:
+            index = np.load(self.index_file, mmap_mode='r')
+        except (IOError, ValueError):
+            return None
+        if len(index) < 3 or index[0] != st.st_mtime_ns or index[1] != st.st_size:
+            return None
+        return index[2:]
+
+    def _build_index(self, st):
+        starts = [np.zeros(1, dtype=np.int64)]
+        with open(self.filename, 'rb') as f:
+            while True:
+                base = f.tell()
+                chunk = f.read(self.CHUNK_SIZE)
+                if len(chunk) == 0:
+                    break
+                newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord('\n'))
+                starts.append(newlines.astype(np.int64) + (base + 1))
+        offsets = np.concatenate(starts)
+        # the last line does not end with a newline
+        if offsets[-1] != st.st_size:
+            offsets = np.append(offsets, st.st_size)
+        index = np.concatenate([[st.st_mtime_ns, st.st_size], offsets]).astype(np.int64)
+        # imported here since fileio imports this module
+        from chino.io.fileio import atomic_open
+        try:
+            with atomic_open(self.index_file) as f:
+                np.save(f, index)
+        except OSError as e:
+            logger.warning('Unable to save line index to %s: %s', self.index_file, e)
+        return offsets
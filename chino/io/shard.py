@@ -0,0 +1,151 @@
+"""Packed image shards with memory-mapped random access.
+
+A list of files is packed into a few large shard files plus an offset index,
+so that reading millions of small images no longer pays for one open call
+per image.  The files of a dataset packed with prefix `data` are:
+
+- `data.meta.json`: format information and the names of the shard files;
+- `data.index.npy`: int64 array [N, 3] of (shard, offset, nbytes);
+- `data.list`: the original filenames, one per line;
+- `data-00000.shard`, ...: the payloads.
+
+Payloads are either the encoded file contents, or images pre-decoded by
+`chino.image.imread` into arrays of a fixed shape and dtype.
+"""
+import json
+import os
+from typing import Sequence
+
+import numpy as np
+
+from chino.io.lineio import read_lines
+
+_VERSION = 1
+_ALIGNMENT = 64
+
+
+def pack_shards(filenames: Sequence[str],
+                prefix: str,
+                shard_size: int = 1 << 30,
+                decode: bool = False,
+                **kwargs) -> int:
+    """
+    Pack files into shards with given prefix and returns the number of
+    shards.  A new shard is started once the current one exceeds `shard_size`
+    bytes.  If `decode` is True, each file is loaded by `chino.image.imread`
+    with kwargs and stored as a raw array.  All arrays must have the same
+    shape, which is guaranteed if `dsize` is given.
+    """
+    dirname = os.path.dirname(prefix)
+    if len(dirname) > 0 and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    if decode:
+        from chino.image import imread
+    index = np.zeros((len(filenames), 3), dtype=np.int64)
+    shards = []
+    shape, dtype = None, None
+    f, offset = None, 0
+    try:
+        for i, filename in enumerate(filenames):
+            if decode:
+                payload = imread(filename, **kwargs)
+                if shape is None:
+                    shape, dtype = payload.shape, payload.dtype
+                elif payload.shape != shape:
+                    raise ValueError('Image {} has shape {}, expected {}'.format(
+                        filename, payload.shape, shape))
+                nbytes = payload.nbytes
+            else:
+                with open(filename, 'rb') as src:
+                    payload = src.read()
+                nbytes = len(payload)
+            if f is None or (offset > 0 and offset + nbytes > shard_size):
+                if f is not None:
+                    f.close()
+                shards.append('{0}-{1:05d}.shard'.format(os.path.basename(prefix),
+                                                         len(shards)))
+                f = open(os.path.join(dirname, shards[-1]), 'wb')
+                offset = 0
+            padding = -offset % _ALIGNMENT
+            f.write(b'\0' * padding)
+            offset += padding
+            f.write(payload)
+            index[i] = (len(shards) - 1, offset, nbytes)
+            offset += nbytes
+    finally:
+        if f is not None:
+            f.close()
+    np.save(prefix + '.index.npy', index)
+    with open(prefix + '.list', 'w', encoding='utf-8') as f:
+        for filename in filenames:
+            f.write(filename + '\n')
+    meta = {
+        'version': _VERSION,
+        'mode': 'decoded' if decode else 'encoded',
+        'count': len(filenames),
+        'shards': shards,
+        'shape': None if shape is None else list(shape),
+        'dtype': None if dtype is None else dtype.str,
+    }
+    # meta is written last, so that a partially packed dataset is not readable
+    with open(prefix + '.meta.json', 'w') as f:
+        json.dump(meta, f)
+    return len(shards)
+
+
+class ShardReader(object):
+    """Random access to images packed by `pack_shards`.
+
+    Shards are memory-mapped on first access and items are returned as
+    read-only views into the mapping without copying.  For encoded shards,
+    an item is a uint8 array of the file contents, which can be decoded by
+    `cv2.imdecode`.  For decoded shards, an item is the array as loaded by
+    `imread`.  The reader can be pickled, e.g. to be sent to data loader
+    workers, in which case the shards are mapped again in the worker.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        with open(prefix + '.meta.json', 'r') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != _VERSION:
+            raise ValueError('Unsupported shard version: {}'.format(self.meta['version']))
+        self.decoded = self.meta['mode'] == 'decoded'
+        self.shape = None if self.meta['shape'] is None else tuple(self.meta['shape'])
+        self.dtype = None if self.meta['dtype'] is None else np.dtype(self.meta['dtype'])
+        self.index = np.load(prefix + '.index.npy', mmap_mode='r')
+        self._names = None
+        self._shards = [None] * len(self.meta['shards'])
+
+    @property
+    def names(self) -> Sequence[str]:
+        """The original filenames."""
+        if self._names is None:
+            self._names = read_lines(self.prefix + '.list')
+        return self._names
+
+    def __len__(self):
+        return self.meta['count']
+
+    def __getitem__(self, i):
+        shard, offset, nbytes = (int(v) for v in self.index[i])
+        data = self._shard(shard)[offset:offset + nbytes]
+        if self.decoded:
+            return data.view(self.dtype).reshape(self.shape)
+        return data
+
+    def _shard(self, i):
+        if self._shards[i] is None:
+            filename = os.path.join(os.path.dirname(self.prefix), self.meta['shards'][i])
+            self._shards[i] = np.memmap(filename, dtype=np.uint8, mode='r')
+        return self._shards[i]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['index'] = None
+        state['_shards'] = [None] * len(self._shards)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.index = np.load(self.prefix + '.index.npy', mmap_mode='r')
@@ -1,7 +1,17 @@
-"""A simple timer for timing."""
+"""A simple timer for timing, and a hierarchical profiler of named scopes."""
+import collections
+import contextvars
+import functools
 import logging
+import math
+import os
+import threading
 import time
-from collections import Iterable
+import weakref
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
 from six import string_types
 
 logger = logging.getLogger(__name__)
@@ -21,13 +31,13 @@ class TicTocTimer(object):
     def tic(self):
         """Begin timing."""
         self.timing = True
-        self.start = time.time()
+        self.start = time.perf_counter()
 
     def toc(self):
         """Return elapsed time."""
         if not self.timing:
             return 0.
-        return time.time() - self.start
+        return time.perf_counter() - self.start
 
     def __enter__(self):
         self.tic()
@@ -39,14 +49,114 @@ class TicTocTimer(object):
         logger.info(self.log_template.format(self.toc()))
 
 
+class LatencyHistogram(object):
+    """Histogram of latencies in constant memory, from which percentiles can
+    be queried at any time.  Similar to HdrHistogram, latencies in
+    nanoseconds are counted in buckets which are linear below 64ns, and
+    split every power of 2 into 32 buckets above, so that percentiles are
+    accurate within about 3%.  Latencies above about 19 hours are counted in
+    the last bucket, and the exact min and max are kept.
+
+    Histograms (e.g. of different workers, after pickling) can be merged."""
+
+    _SUB_BUCKETS = 32
+    _NUM_BUCKETS = 2 * _SUB_BUCKETS + 40 * _SUB_BUCKETS
+
+    def __init__(self):
+        self.counts = [0] * self._NUM_BUCKETS
+        self.count = 0
+        self.total = 0.
+        self.min = None
+        self.max = 0.
+
+    def record(self, seconds):
+        """Records a latency in seconds."""
+        self.counts[_bucket(int(seconds * 1e9))] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        """Adds counts of another histogram into this one and returns it."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, q):
+        """Returns the q-th percentile (0 <= q <= 100) of latencies in
+        seconds, or 0 if nothing has been recorded."""
+        if self.count == 0:
+            return 0.
+        if q <= 0:
+            return self.min
+        if q >= 100:
+            return self.max
+        rank = max(int(math.ceil(q / 100. * self.count)), 1)
+        seen = 0
+        for index, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                break
+        low, high = _bucket_range(index)
+        value = (low + high - 1) / 2. / 1e9
+        return min(max(value, self.min), self.max)
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """Returns a dict of count, mean, max and the given percentiles (as
+        `p50` etc.) in seconds."""
+        out = {'count': self.count,
+               'mean': self.total / self.count if self.count > 0 else 0.,
+               'max': self.max}
+        for q in percentiles:
+            out['p{0:g}'.format(q)] = self.percentile(q)
+        return out
+
+
+def _bucket(ns):
+    sub = LatencyHistogram._SUB_BUCKETS
+    if ns < 2 * sub:
+        return max(ns, 0)
+    shift = ns.bit_length() - 6  # keep the top 6 bits, i.e. 32 to 63
+    return min(2 * sub + (shift - 1) * sub + (ns >> shift) - sub,
+               LatencyHistogram._NUM_BUCKETS - 1)
+
+
+def _bucket_range(index):
+    """Returns [low, high) of bucket index in nanoseconds."""
+    sub = LatencyHistogram._SUB_BUCKETS
+    if index < 2 * sub:
+        return index, index + 1
+    shift = (index - 2 * sub) // sub + 1
+    mantissa = (index - 2 * sub) % sub + sub
+    return mantissa << shift, (mantissa + 1) << shift
+
+
 class Timer(TicTocTimer):
-    """Timer that supports recording multiple time slots."""
+    """Timer that supports recording multiple time slots.  Time slots are
+    also recorded in a LatencyHistogram, e.g. `timer.histogram.percentile(99)`.
+    """
 
     def __init__(self, log_template=None):
         super(Timer, self).__init__(log_template)
         self.total = 0.
         self.current = 0.
         self.count = 0
+        self.histogram = LatencyHistogram()
+
+    def merge(self, other):
+        """Adds time slots recorded by another timer, e.g. of another worker,
+        into this one and returns it."""
+        self.total += other.total
+        self.count += other.count
+        self.histogram.merge(other.histogram)
+        return self
 
     def toc(self, mode='elapsed'):
         """Support multiple modes for timing.
@@ -63,43 +173,407 @@ class Timer(TicTocTimer):
         """
         if not self.timing:
             return self.current
-        self.current = time.time() - self.start
+        self.current = time.perf_counter() - self.start
         if mode == 'elapsed':
             return self.current
         elif mode == 'cumulative':
             self.total += self.current
             self.count += 1
+            self.histogram.record(self.current)
             self.timing = False
             return self.total
-        elif mode == 'avarage':
+        elif mode in ('average', 'avarage'):
             self.total += self.current
             self.count += 1
+            self.histogram.record(self.current)
             self.timing = False
             return self.total / self.count
         else:
             raise KeyError('Unknown timer mode: {}'.format(mode))
 
 
-__GT = {}  # a dict holding global timers
+# Start times of global timers of the current thread or asyncio task, which
+# are copied on write, so that tasks do not see timers started by each other.
+_GT = contextvars.ContextVar('chino_timers', default={})
 
 
 def tic(name='default'):
-    """Global timer starts.  Support a list of timer names."""
+    """Global timer starts.  Support a list of timer names.  Global timers
+    are local to the current thread or asyncio task, where tasks inherit
+    timers started before they are created."""
     if isinstance(name, string_types):
         name = [name]
     elif isinstance(name, Iterable):
         assert all([isinstance(n, string_types) for n in name])
     else:
         raise KeyError('Invalid name or list of names: {}'.format(name))
+    timers = dict(_GT.get())
+    start = time.perf_counter()
     for n in name:
-        if n not in __GT:
-            __GT.update({n: TicTocTimer()})
-        __GT[n].tic()
+        timers[n] = start
+    _GT.set(timers)
 
 
 def toc(name='default'):
     """Global timer returns elapsed time."""
-    if name in __GT:
-        return __GT[name].toc()
-    else:
+    start = _GT.get().get(name)
+    if start is None:
         raise KeyError('Timer {} has not been initialized'.format(name))
+    return time.perf_counter() - start
+
+
+class _ScopeStats(object):
+    """Statistics of a scope in nanoseconds."""
+    __slots__ = ('count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+
+class _ThreadStats(object):
+    """Holder of the statistics of a thread in a thread-local, which is
+    released when the thread exits."""
+    __slots__ = ('stats', '__weakref__')
+
+    def __init__(self):
+        self.stats = {}
+
+
+def _retire_stats(profiler_ref, stats, ident):
+    profiler = profiler_ref()
+    if profiler is not None:
+        profiler._retire(stats, ident)
+
+
+class _Scope(object):
+    """A named scope of a Profiler, used as a context manager or decorator.
+    Scopes hold no timing state, so that they are cached and reentrant."""
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        profiler = self.profiler
+        if profiler.enabled:
+            top = profiler._top.get()
+            path = self.name if top is None else top[0] + '/' + self.name
+            profiler._top.set((path, self.name, top, time.perf_counter_ns()))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        profiler = self.profiler
+        top = profiler._top.get()
+        if top is not None and top[1] == self.name:
+            profiler._top.set(top[2])
+            profiler._record(top[0], top[3], end)
+
+    def __call__(self, fn):
+        profiler = self.profiler
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return fn(*args, **kwargs)
+            with self:
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+class _NullScope(object):
+    """Scope returned by disabled profilers."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def __call__(self, fn):
+        return fn
+
+
+_NULL_SCOPE = _NullScope()
+
+
+class Profiler(object):
+    """Hierarchical profiler of nested named scopes.  Statistics (count,
+    total, mean, min and max time) are recorded per path of scopes, e.g.
+    `train/load`, using time.perf_counter_ns.  Recording a scope costs about
+    a microsecond; if the profiler is disabled, scopes are not recorded and
+    cost about as much as a function call.
+
+    The profiler can be used by multiple threads and asyncio tasks: the
+    current path is kept in a context variable, so each thread or task has
+    its own (tasks continue the path where they are created), and each
+    thread records into its own statistics without locking.  `stats` and
+    `report` aggregate the statistics of all threads.
+
+    If tracing is started (or trace_size is given), each scope is also
+    recorded as an event into a ring buffer of the latest events, which can
+    be dumped in the Chrome trace event format by `dump_trace` and viewed in
+    chrome://tracing or Perfetto.
+
+    Example:
+        prof = Profiler()
+        with prof.scope('train'):
+            with prof.scope('load'):
+                ...
+            prof.tic('step')
+            ...
+            prof.toc('step')
+
+        @prof.scope('evaluate')
+        def evaluate():
+            ...
+
+        print(prof.report())
+    """
+
+    def __init__(self, enabled=True, trace_size=None):
+        self.enabled = enabled
+        self._scopes = {}
+        # innermost scope as (path, name, parent, start time)
+        self._top = contextvars.ContextVar('chino_profiler_{0}'.format(id(self)),
+                                           default=None)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread_stats = []
+        # statistics merged from threads which have exited
+        self._retired = {}
+        self._thread_names = {}
+        self._events = collections.deque()
+        self._trace = None
+        if trace_size is not None:
+            self.start_trace(trace_size)
+
+    def scope(self, name):
+        """Returns the scope of name, to be used as a context manager or a
+        decorator.  Names should not contain '/'.  Functions decorated while
+        the profiler is disabled are never recorded."""
+        if not self.enabled:
+            return _NULL_SCOPE
+        scope = self._scopes.get(name)
+        if scope is None:
+            scope = self._scopes[name] = _Scope(self, name)
+        return scope
+
+    def tic(self, name):
+        """Enters scope name, which should be left by toc."""
+        self.scope(name).__enter__()
+
+    def toc(self, name=None):
+        """Leaves the innermost scope, which should be name if given, and
+        returns its elapsed time in seconds (0 if disabled)."""
+        end = time.perf_counter_ns()
+        top = self._top.get()
+        if top is None:
+            if not self.enabled:
+                return 0.
+            raise KeyError('No scope has been entered.')
+        if name is not None and top[1] != name:
+            raise KeyError('Unable to leave scope {0} inside scope '
+                           '{1}'.format(name, top[1]))
+        self._top.set(top[2])
+        self._record(top[0], top[3], end)
+        return (end - top[3]) / 1e9
+
+    def start_trace(self, max_events=1000000):
+        """Starts recording scopes as events, keeping the latest max_events
+        ones.  Previously recorded events are discarded."""
+        self._events = self._trace = collections.deque(maxlen=max_events)
+
+    def stop_trace(self):
+        """Stops recording events, which are kept for dump_trace."""
+        self._trace = None
+
+    def dump_trace(self, filename):
+        """Dumps recorded events to a json file in the Chrome trace event
+        format."""
+        from chino.io.fileio import save
+        pid = os.getpid()
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                   'args': {'name': name}}
+                  for tid, name in list(self._thread_names.items())]
+        for path, tid, start, end in list(self._events):
+            events.append({'name': path.rpartition('/')[2], 'cat': 'chino', 'ph': 'X',
+                           'ts': start / 1e3, 'dur': (end - start) / 1e3,
+                           'pid': pid, 'tid': tid, 'args': {'path': path}})
+        save(filename, {'traceEvents': events, 'displayTimeUnit': 'ms'})
+
+    def reset(self):
+        """Removes all recorded statistics."""
+        with self._lock:
+            for stats in self._thread_stats:
+                stats.clear()
+            self._retired.clear()
+
+    def _record(self, path, start, end):
+        elapsed = end - start
+        trace = self._trace
+        if trace is not None:
+            trace.append((path, threading.get_ident(), start, end))
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            holder = self._local.holder = _ThreadStats()
+            ident = threading.get_ident()
+            weakref.finalize(holder, _retire_stats, weakref.ref(self), holder.stats, ident)
+            with self._lock:
+                self._thread_stats.append(holder.stats)
+                self._thread_names[ident] = threading.current_thread().name
+        stats = holder.stats
+        node = stats.get(path)
+        if node is None:
+            node = stats[path] = _ScopeStats()
+        node.count += 1
+        node.total += elapsed
+        if node.min is None or elapsed < node.min:
+            node.min = elapsed
+        if elapsed > node.max:
+            node.max = elapsed
+
+    def _retire(self, stats, ident):
+        """Merges the statistics of an exited thread into the retired ones,
+        so that they are not kept per thread."""
+        with self._lock:
+            for i, other in enumerate(self._thread_stats):
+                if other is stats:
+                    del self._thread_stats[i]
+                    break
+            for path, node in list(stats.items()):
+                self._retired.setdefault(path, _ScopeStats()).merge(node)
+            if not self._events:
+                self._thread_names.pop(ident, None)
+
+    def _aggregate(self):
+        """Returns a dict from paths to _ScopeStats merged over threads,
+        including ancestors which have not been left yet."""
+        with self._lock:
+            thread_stats = list(self._thread_stats)
+            retired = {}
+            for path, node in self._retired.items():
+                retired[path] = _ScopeStats()
+                retired[path].merge(node)
+        out = {}
+        for stats in [retired] + thread_stats:
+            for path, node in list(stats.items()):
+                parts = path.split('/')
+                for i in range(1, len(parts)):
+                    out.setdefault('/'.join(parts[:i]), _ScopeStats())
+                out.setdefault(path, _ScopeStats()).merge(node)
+        return out
+
+    def stats(self):
+        """Returns a dict from paths of scopes (joined by '/') to dicts of
+        count, and total, mean, min and max time in seconds."""
+        out = {}
+        for path, node in self._aggregate().items():
+            out[path] = {'count': node.count,
+                         'total': node.total / 1e9,
+                         'mean': node.total / node.count / 1e9 if node.count > 0 else 0.,
+                         'min': (node.min or 0) / 1e9,
+                         'max': node.max / 1e9}
+        return out
+
+    def report(self, sort='total'):
+        """Returns the statistics formatted as a tree, where child scopes are
+        sorted by `total`, `count`, `mean`, `max` or `name` (the order in
+        which they are first left if None)."""
+        stats = self._aggregate()
+        children = {}
+        for path in stats:
+            children.setdefault(path.rpartition('/')[0], []).append(path)
+        lines = ['{0:<40s} {1:>8s} {2:>12s} {3:>12s} {4:>12s} {5:>12s}'.format(
+            'scope', 'count', 'total(ms)', 'mean(ms)', 'min(ms)', 'max(ms)')]
+        for path, depth in _walk(children, stats, '', 0, sort):
+            node = stats[path]
+            mean = node.total / node.count if node.count > 0 else 0
+            lines.append('{0:<40s} {1:>8d} {2:>12.3f} {3:>12.3f} {4:>12.3f} {5:>12.3f}'.format(
+                '  ' * depth + path.rpartition('/')[2], node.count, node.total / 1e6,
+                mean / 1e6, (node.min or 0) / 1e6, node.max / 1e6))
+        return '\n'.join(lines)
+
+
+_SORT_KEYS = {
+    'total': lambda path, node: -node.total,
+    'count': lambda path, node: -node.count,
+    'mean': lambda path, node: -node.total / max(node.count, 1),
+    'max': lambda path, node: -node.max,
+    'name': lambda path, node: path,
+}
+
+
+def _walk(children, stats, path, depth, sort):
+    """Yields (path, depth) of all descendants of path in depth first
+    order."""
+    paths = children.get(path, [])
+    if sort is not None:
+        paths = sorted(paths, key=lambda p: _SORT_KEYS[sort](p, stats[p]))
+    for child in paths:
+        yield child, depth
+        for item in _walk(children, stats, child, depth + 1, sort):
+            yield item
+
+
+profiler = Profiler()  # the global profiler
+
+
+def profile(name):
+    """Returns a scope of the global profiler, e.g. `with profile('load'):`
+    or `@profile('load')`.  A function can also be decorated by `@profile`,
+    whose scope is named after its qualified name."""
+    if callable(name):
+        return profiler.scope(name.__qualname__)(name)
+    return profiler.scope(name)
+
+
+def enable_profiling(enabled=True):
+    """Globally enables or disables recording of the global profiler."""
+    profiler.enabled = enabled
+
+
+def summarize_trace(trace, by_path=False):
+    """Summarizes a trace in the Chrome trace event format (the loaded dict,
+    or the list of events), with complete (`X`) or begin/end (`B`/`E`)
+    events.  Returns a list of (name, count, total, max) of events grouped
+    by name (or by `path` in args if by_path is True), where times are in
+    microseconds, sorted by total time."""
+    events = trace['traceEvents'] if isinstance(trace, dict) else trace
+    summary = {}
+    stacks = collections.defaultdict(list)
+    for event in events:
+        phase = event.get('ph')
+        if phase == 'B':
+            stacks[(event.get('pid'), event.get('tid'))].append(event)
+            continue
+        elif phase == 'E':
+            stack = stacks[(event.get('pid'), event.get('tid'))]
+            if len(stack) == 0:
+                continue
+            begin = stack.pop()
+            dur = event['ts'] - begin['ts']
+            event = begin
+        elif phase == 'X':
+            dur = event.get('dur', 0)
+        else:
+            continue
+        key = event.get('name', '')
+        if by_path:
+            key = event.get('args', {}).get('path', key)
+        count, total, longest = summary.get(key, (0, 0, 0))
+        summary[key] = (count + 1, total + dur, max(longest, dur))
+    return sorted(((key,) + value for key, value in summary.items()),
+                  key=lambda item: -item[2])
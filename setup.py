@@ -11,7 +11,7 @@ setup(
     description="Utilities used for the author's research",
     license='MIT',
     packages=['chino'],
-    install_requires=['pyyaml', 'addict', 'opencv-python', 'six', 'numpy', 'click'],
+    install_requires=['pyyaml', 'opencv-python', 'six', 'numpy', 'click'],
     classifiers=[
         "Programming Language :: Python :: 2.7",
         "Programming Language :: Python :: 3",
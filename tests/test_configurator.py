@@ -1,4 +1,13 @@
 """Test script for chino configurator."""
+import contextlib
+import io
+import multiprocessing
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 import numpy as np
 import chino.configurator as cc
@@ -43,6 +52,287 @@ class TestMerge(unittest.TestCase):
             cc._merge_dict_into_Dict(d2, lcfg)
 
 
+class TestMergeFromYml(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.yml = os.path.join(self.folder, 'cfg.yml')
+        with open(self.yml, 'w') as f:
+            f.write('SVM:\n  C: 10\n  IMPL: generic\nIMG_MEAN: [1, 2, 3]\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _cfg(self):
+        lcfg = FrozenDict()
+        lcfg.SVM.C = 100.
+        lcfg.SVM.IMPL = 'lbfgs'
+        lcfg.IMG_MEAN = np.zeros(3, dtype=np.float32)
+        lcfg.freeze()
+        return lcfg
+
+    def _check(self, lcfg):
+        self.assertEqual(lcfg.SVM.C, 10.)
+        self.assertIsInstance(lcfg.SVM.C, float)
+        self.assertEqual(lcfg.SVM.IMPL, 'generic')
+        self.assertEqual(lcfg.IMG_MEAN.dtype, np.float32)
+        self.assertTrue(np.allclose(lcfg.IMG_MEAN, [1, 2, 3]))
+
+    def test_merge_from_yml(self):
+        lcfg = self._cfg()
+        cc.merge_from_yml(self.yml, lcfg)
+        self._check(lcfg)
+
+    def test_cache(self):
+        cache_dir = os.path.join(self.folder, 'cache')
+        lcfg = self._cfg()
+        cc.merge_from_yml(self.yml, lcfg, cache=cache_dir)
+        self._check(lcfg)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        lcfg = self._cfg()
+        cc.merge_from_yml(self.yml, lcfg, cache=cache_dir)
+        self._check(lcfg)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        # a different default cfg gets a different entry
+        lcfg = self._cfg()
+        lcfg.SVM.IMPL = 'other'
+        cc.merge_from_yml(self.yml, lcfg, cache=cache_dir)
+        self._check(lcfg)
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_ndarray(self):
+        anchors = np.random.rand(5, 4).astype(np.float32)
+        np.save(os.path.join(self.folder, 'anchors.npy'), anchors)
+        np.savez(os.path.join(self.folder, 'weights.npz'), train=anchors[0])
+        with open(self.yml, 'w') as f:
+            f.write('ANCHORS: !ndarray anchors.npy\n'
+                    'WEIGHTS: !ndarray {path: weights.npz, key: train}\n')
+        lcfg = FrozenDict()
+        lcfg.ANCHORS = np.zeros((0, 4), dtype=np.float32)
+        lcfg.WEIGHTS = np.zeros(4, dtype=np.float32)
+        lcfg.freeze()
+        cache_dir = os.path.join(self.folder, 'cache')
+        cc.merge_from_yml(self.yml, lcfg, cache=cache_dir)
+        self.assertFalse(os.path.exists(cache_dir))
+        for name, expected in (('ANCHORS', anchors), ('WEIGHTS', anchors[0])):
+            self.assertIsInstance(lcfg[name], np.memmap)
+            self.assertTrue(np.array_equal(lcfg[name], expected))
+        # N-D arrays are given by paths on command line
+        parser = cc.cfg_parser(lcfg)
+        args = parser.parse_args(['--ANCHORS', os.path.join(self.folder, 'anchors.npy')])
+        cc.merge_from_parser_args(args, lcfg)
+        self.assertIsInstance(lcfg.ANCHORS, np.memmap)
+        lcfg.ANCHORS = np.zeros((0, 4), dtype=np.float64)
+        with self.assertRaises(ValueError):
+            cc.merge_from_yml(self.yml, lcfg)
+        # members of compressed npz files are loaded, and checked as well
+        np.savez_compressed(os.path.join(self.folder, 'weights.npz'),
+                            train=np.ones(4, dtype=np.float64))
+        lcfg.ANCHORS = np.zeros((0, 4), dtype=np.float32)
+        with self.assertRaises(ValueError):
+            cc.merge_from_yml(self.yml, lcfg)
+        # nor are configs with loaded arrays cached, which would be stale
+        with open(self.yml, 'w') as f:
+            f.write('WEIGHTS: !ndarray {path: weights.npz, key: train}\n')
+        for value in (1, 5):
+            np.savez_compressed(os.path.join(self.folder, 'weights.npz'),
+                                train=np.full(4, value, dtype=np.float32))
+            lcfg = FrozenDict(WEIGHTS=np.zeros(4, dtype=np.float32))
+            cc.merge_from_yml(self.yml, lcfg, cache=cache_dir)
+            self.assertTrue(np.array_equal(lcfg.WEIGHTS, np.full(4, value)))
+        self.assertFalse(os.path.exists(cache_dir))
+
+    def test_base(self):
+        base = os.path.join(self.folder, 'base.yml')
+        with open(base, 'w') as f:
+            f.write('SVM:\n  C: 1\n  IMPL: base\n')
+        os.makedirs(os.path.join(self.folder, 'exps'))
+        children = []
+        for i in range(2):
+            children.append(os.path.join(self.folder, 'exps', '{}.yml'.format(i)))
+            with open(children[-1], 'w') as f:
+                f.write('_base_: [../base.yml, ../cfg.yml]\nSVM:\n  IMPL: child{}\n'.format(i))
+        for i, child in enumerate(children):
+            lcfg = self._cfg()
+            cc.merge_from_yml(child, lcfg)
+            self.assertEqual(lcfg.SVM.C, 10.)  # the later base wins
+            self.assertEqual(lcfg.SVM.IMPL, 'child{}'.format(i))
+            self.assertTrue(np.allclose(lcfg.IMG_MEAN, [1, 2, 3]))
+            if i == 0:
+                parsed = cc._PARSED_YML[os.path.realpath(base)]
+        # bases are parsed once, until modified
+        self.assertIs(cc._PARSED_YML[os.path.realpath(base)], parsed)
+        cache_dir = os.path.join(self.folder, 'cache')
+        cc.merge_from_yml(children[0], self._cfg(), cache=cache_dir)
+        with open(self.yml, 'w') as f:
+            f.write('SVM:\n  C: 20\n')
+        for _ in range(2):
+            lcfg = self._cfg()
+            cc.merge_from_yml(children[0], lcfg, cache=cache_dir)
+            self.assertEqual(lcfg.SVM.C, 20.)
+        with open(base, 'w') as f:
+            f.write('_base_: exps/0.yml\n')
+        with self.assertRaises(ValueError):
+            cc.merge_from_yml(children[0], self._cfg())
+
+
+class TestExpandSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.cfg = FrozenDict()
+        self.cfg.SOLVER.LR = 0.01
+        self.cfg.SOLVER.WD = 0.
+        self.cfg.MODEL.DEPTH = 18
+        self.cfg.DATA.SIZE = 3
+        self.cfg.NAME = 'default'
+        self.cfg.freeze()
+
+    def test_grid(self):
+        cfgs = list(cc.expand_sweep(self.cfg, {'SOLVER.LR': [0.1, '1e-3'],
+                                               'MODEL.DEPTH': [18, 34, 50]}))
+        self.assertEqual(len(cfgs), 6)
+        self.assertListEqual([(c.SOLVER.LR, c.MODEL.DEPTH) for c in cfgs],
+                             [(0.1, 18), (0.1, 34), (0.1, 50),
+                              (1e-3, 18), (1e-3, 34), (1e-3, 50)])
+        self.assertIsInstance(cfgs[0].SOLVER.LR, float)
+        self.assertEqual(self.cfg.SOLVER.LR, 0.01)
+        with self.assertRaises(KeyError):
+            list(cc.expand_sweep(self.cfg, {'SOLVER.MOMENTUM': [0.9]}))
+        with self.assertRaises(ValueError):
+            list(cc.expand_sweep(self.cfg, {'MODEL.DEPTH': ['deep']}))
+
+    def test_independent_configs(self):
+        cfgs = list(cc.expand_sweep(self.cfg, {'SOLVER.LR': [0.1, 0.2]}))
+        # subtrees shared with the base are copied when assigned to
+        cfgs[0].DATA.SIZE = 7
+        self.assertListEqual([c.DATA.SIZE for c in cfgs], [7, 3])
+        self.assertEqual(self.cfg.DATA.SIZE, 3)
+        self.cfg.DATA.SIZE = 5
+        self.assertListEqual([c.DATA.SIZE for c in cfgs], [7, 3])
+        cfgs[1].SOLVER.WD = 1e-4
+        self.assertEqual((cfgs[0].SOLVER.WD, self.cfg.SOLVER.WD), (0., 0.))
+
+    def test_zip_random_and_list(self):
+        spec = [
+            {'zip': {'SOLVER.LR': [0.1, 0.2], 'NAME': ['a', 'b']}},
+            {'random': {'SOLVER.WD': lambda rng: rng.uniform(0., 1e-3),
+                        'MODEL.DEPTH': [18, 50]},
+             'num_samples': 5},
+        ]
+        cfgs = list(cc.expand_sweep(self.cfg, spec, seed=1))
+        self.assertEqual(len(cfgs), 7)
+        self.assertListEqual([c.NAME for c in cfgs[:2]], ['a', 'b'])
+        self.assertTrue(all(0. <= c.SOLVER.WD <= 1e-3 for c in cfgs[2:]))
+        self.assertTrue(all(c.MODEL.DEPTH in (18, 50) for c in cfgs[2:]))
+        # shards are disjoint, cover the sweep and agree on random points
+        sharded = [list(cc.expand_sweep(self.cfg, spec, shard='{}/3'.format(i), seed=1))
+                   for i in range(3)]
+        self.assertListEqual([len(s) for s in sharded], [3, 2, 2])
+        for i, c in enumerate(cfgs):
+            s = sharded[i % 3][i // 3]
+            self.assertEqual((s.NAME, s.SOLVER.WD, s.MODEL.DEPTH),
+                             (c.NAME, c.SOLVER.WD, c.MODEL.DEPTH))
+
+
+class TestMemoizeOnCfg(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_memoize(self):
+        calls = []
+
+        def _fn(data_cfg, scale=1):
+            calls.append(data_cfg.SIZE)
+            return np.ones(data_cfg.SIZE) * scale
+
+        lcfg = FrozenDict()
+        lcfg.DATA.SIZE = 3
+        lcfg.NAME = 'a'
+        lcfg.freeze()
+        fn = cc.memoize_on_cfg(cache_dir=self.folder)(_fn)
+        self.assertTrue(np.array_equal(fn(lcfg.DATA), np.ones(3)))
+        self.assertIs(fn(lcfg.DATA), fn(lcfg.DATA))
+        lcfg.NAME = 'b'  # other parts of cfg do not matter
+        fn(lcfg.DATA)
+        self.assertEqual(len(calls), 1)
+        fn(lcfg.DATA, scale=2)
+        lcfg.DATA.SIZE = 4
+        fn(lcfg.DATA)
+        self.assertListEqual(calls, [3, 3, 4])
+        # the disk tier is shared with another process
+        fn = cc.memoize_on_cfg(cache_dir=self.folder)(_fn)
+        lcfg.DATA.SIZE = 3
+        self.assertTrue(np.array_equal(fn(lcfg.DATA, scale=2), np.ones(3) * 2))
+        self.assertListEqual(calls, [3, 3, 4])
+        # truncated entries are computed and written again
+        for entry in os.listdir(self.folder):
+            with open(os.path.join(self.folder, entry), 'r+b') as f:
+                f.truncate(10)
+        fn = cc.memoize_on_cfg(cache_dir=self.folder)(_fn)
+        with self.assertLogs('chino.configurator', level='WARNING'):
+            self.assertTrue(np.array_equal(fn(lcfg.DATA), np.ones(3)))
+        self.assertListEqual(calls, [3, 3, 4, 3])
+        fn = cc.memoize_on_cfg(cache_dir=self.folder)(_fn)
+        self.assertTrue(np.array_equal(fn(lcfg.DATA), np.ones(3)))
+        self.assertListEqual(calls, [3, 3, 4, 3])
+
+
+def _attach_and_sum(shared):
+    shared_cfg = shared.attach()
+    return float(shared_cfg.DATA.MEAN.sum()), shared_cfg.DATA.MEAN.flags.writeable
+
+
+class TestShareCfg(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cfg = FrozenDict()
+        self.cfg.DATA.MEAN = np.arange(1000, dtype=np.float32)
+        self.cfg.DATA.NAMES = ['a', 'b']
+        self.cfg.freeze()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_share(self):
+        for path in (None, os.path.join(self.folder, 'cfg.pkl')):
+            shared = cc.share_cfg(self.cfg, path=path)
+            try:
+                with multiprocessing.Pool(2) as pool:
+                    results = pool.map(_attach_and_sum, [shared] * 2)
+                self.assertEqual(results, [(float(self.cfg.DATA.MEAN.sum()), False)] * 2)
+                shared_cfg = pickle.loads(pickle.dumps(shared)).attach()
+                self.assertEqual(shared_cfg.content_hash(), self.cfg.content_hash())
+                self.assertTrue(shared_cfg.is_frozen())
+                with self.assertRaises(KeyError):
+                    shared_cfg.DATA.NAMES = []
+                self.assertEqual(shared_cfg.derive({'DATA.NAMES': ['c']}).DATA.NAMES, ['c'])
+            finally:
+                shared.unlink()
+        with self.assertRaises(ValueError):
+            cc.share_cfg(FrozenDict())
+
+    def test_attach_from_interpreter(self):
+        shared = cc.share_cfg(self.cfg)
+        code = ('import pickle, sys; shared = pickle.loads(bytes.fromhex(sys.argv[1])); '
+                'print(float(shared.attach().DATA.MEAN.sum()))')
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(cc.__file__)))
+        try:
+            # the block outlives interpreters which attach to it and exit
+            for _ in range(2):
+                out = subprocess.run([sys.executable, '-c', code, pickle.dumps(shared).hex()],
+                                     env=env, capture_output=True, check=True)
+                self.assertEqual(float(out.stdout), float(self.cfg.DATA.MEAN.sum()))
+                self.assertEqual(out.stderr, b'')
+        finally:
+            pickle.loads(pickle.dumps(shared)).unlink()
+        shared.unlink()
+
+
 class TestCfgParser(unittest.TestCase):
 
     def setUp(self):
@@ -78,6 +368,47 @@ class TestCfgParser(unittest.TestCase):
         self.assertTrue(np.allclose(self.cfg.IMG_MEAN,
                                     np.array([1.2, 2.3, 3.4])))
 
+    def test_merge_from_argv(self):
+        cc.merge_from_argv("""
+            SVM.ENABLED=false --SVM.C 1000. SVM.IMPL=generic --NAME TestParser
+            --IMG_SIZE 256 256 1 --IMG_MEAN 1.2 2.3 3.4 VARY_LEN=[5,6,7]
+            --TO_BE_EMPTY
+        """.split(), self.cfg)
+        self.assertFalse(self.cfg.SVM.ENABLED)
+        self.assertEqual(self.cfg.SVM.C, 1000.)
+        self.assertEqual(self.cfg.SVM.IMPL, 'generic')
+        self.assertEqual(self.cfg.NAME, 'TestParser')
+        self.assertSequenceEqual(self.cfg.IMG_SIZE, [256, 256, 1])
+        self.assertListEqual(self.cfg.VARY_LEN, [5, 6, 7])
+        self.assertListEqual(self.cfg.TO_BE_EMPTY, [])
+        self.assertTrue(np.allclose(self.cfg.IMG_MEAN, np.array([1.2, 2.3, 3.4])))
+        cc.merge_from_argv(['--VARY_LEN', '8'], self.cfg)
+        self.assertListEqual(self.cfg.VARY_LEN, [8])
+        # values may contain '='
+        cc.merge_from_argv(['--NAME', 'a=b', 'SVM.IMPL=c=d', '--VARY_LEN', '1', '2',
+                            'SVM.C=3'], self.cfg)
+        self.assertEqual((self.cfg.NAME, self.cfg.SVM.IMPL, self.cfg.SVM.C),
+                         ('a=b', 'c=d', 3.))
+        self.assertListEqual(self.cfg.VARY_LEN, [1, 2])
+        with self.assertRaisesRegex(KeyError, 'did you mean SVM.IMPL'):
+            cc.merge_from_argv(['SVM.IMLP=x'], self.cfg)
+        with self.assertRaises(ValueError):
+            cc.merge_from_argv(['NAME', 'x'], self.cfg)
+        with self.assertRaises(ValueError):
+            cc.merge_from_argv(['--SVM.C', '1', '2'], self.cfg)
+        with self.assertRaises(SystemExit), \
+                contextlib.redirect_stdout(io.StringIO()) as out:
+            cc.merge_from_argv(['NAME=x', '--help'], self.cfg)
+        self.assertIn('--SVM.IMPL', out.getvalue())
+
+    def test_parse_nested_args(self):
+        cfg = FrozenDict()
+        cfg.MODEL.HEAD.DIM = 128
+        cfg.freeze()
+        args = cc.cfg_parser(cfg).parse_args(['--MODEL.HEAD.DIM', '64'])
+        cc.merge_from_parser_args(args, cfg)
+        self.assertEqual(cfg.MODEL.HEAD.DIM, 64)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,243 @@
+"""Test script for chino file IO."""
+import os
+import shutil
+import tempfile
+import json
+import pickle
+import unittest
+import numpy as np
+from chino.io.cache import LoadCache
+from chino.io.fileio import load, load_array, load_many, save
+
+
+class TestLoadTsv(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, 'a.tsv')
+        with open(self.filename, 'w') as f:
+            for i in range(7):
+                f.write('{0}\tname{0}\t{1}\n'.format(i, i * 0.5))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_plain_text(self):
+        rows = load(self.filename, as_plain_text=True)
+        self.assertEqual(len(rows), 7)
+        self.assertListEqual(rows[1], ['1', 'name1', '0.5'])
+        rows = load(self.filename, as_plain_text=True, usecols=[2, 0],
+                    dtype={0: int, 2: float})
+        self.assertListEqual(rows[3], [1.5, 3])
+        chunks = list(load(self.filename, as_plain_text=True, chunksize=3,
+                           usecols=[1]))
+        self.assertListEqual([len(c) for c in chunks], [3, 3, 1])
+        self.assertListEqual(chunks[2], [['name6']])
+
+    def test_empty_fields(self):
+        filename = os.path.join(self.folder, 'b.tsv')
+        with open(filename, 'w') as f:
+            f.write('\tb\tc \r\n\na\t\t\n')
+        rows = load(filename, as_plain_text=True)
+        self.assertListEqual(rows, [['', 'b', 'c '], ['a', '', '']])
+        rows = load(filename, as_plain_text=True, usecols=[0, 2])
+        self.assertListEqual(rows, [['', 'c '], ['a', '']])
+
+    def test_dataframe(self):
+        df = load(self.filename)
+        self.assertEqual(df.shape, (7, 3))
+        chunks = list(load(self.filename, chunksize=3, usecols=[0, 2],
+                           dtype={0: 'int32'}))
+        self.assertListEqual([len(c) for c in chunks], [3, 3, 1])
+        self.assertListEqual(list(chunks[0].columns), [0, 2])
+        self.assertEqual(str(chunks[1][0].dtype), 'int32')
+
+    def test_compressed(self):
+        import gzip
+        import lzma
+        with open(self.filename, 'rb') as f:
+            content = f.read()
+        for ext, module in (('.gz', gzip), ('.xz', lzma)):
+            filename = self.filename + ext
+            with module.open(filename, 'wb') as f:
+                f.write(content)
+            self.assertListEqual(load(filename, as_plain_text=True),
+                                 load(self.filename, as_plain_text=True))
+            chunks = list(load(filename, as_plain_text=True, chunksize=4))
+            self.assertListEqual([len(c) for c in chunks], [4, 3])
+            self.assertTrue(load(filename).equals(load(self.filename)))
+        filename = os.path.join(self.folder, 'a.json.gz')
+        with gzip.open(filename, 'wt') as f:
+            json.dump({'a': 1}, f)
+        self.assertEqual(load(filename), {'a': 1})
+
+
+class TestLoadCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.folder, 'cache')
+        self.filename = os.path.join(self.folder, 'a.json')
+        with open(self.filename, 'w') as f:
+            json.dump({'a': [1, 2, 3]}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_cache(self):
+        cache = LoadCache(self.cache_dir)
+        data = load(self.filename, cache=cache)
+        self.assertEqual(data, {'a': [1, 2, 3]})
+        data['a'].append(4)  # results are not shared between loads
+        self.assertEqual(load(self.filename, cache=cache), {'a': [1, 2, 3]})
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # a new process reads the sidecar
+        cache = LoadCache(self.cache_dir)
+        self.assertEqual(load(self.filename, cache=cache), {'a': [1, 2, 3]})
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        # modified files are parsed again, replacing the old entry
+        with open(self.filename, 'w') as f:
+            json.dump({'b': 1}, f)
+        self.assertEqual(load(self.filename, cache=cache), {'b': 1})
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_unreadable_entries(self):
+        cache = LoadCache(self.cache_dir)
+        load(self.filename, cache=cache)
+        entry = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+        # entries refer to removed modules or attributes, or are truncated
+        for blob in (b'cchino_removed_module\nThing\n.', b'cos\nremoved_attr\n.', b'\x80'):
+            with open(entry, 'wb') as f:
+                f.write(blob)
+            cache = LoadCache(self.cache_dir)
+            with self.assertLogs('chino.io.cache', level='WARNING'):
+                self.assertEqual(load(self.filename, cache=cache), {'a': [1, 2, 3]})
+            self.assertEqual((cache.hits, cache.misses), (0, 1))
+        # the entry is rewritten
+        self.assertEqual(load(self.filename, cache=LoadCache(self.cache_dir)), {'a': [1, 2, 3]})
+        # errors of the loader are not chained to cache misses
+        with open(entry, 'wb') as f:
+            f.write(b'\x80')
+
+        def _fail(filename):
+            raise RuntimeError(filename)
+        with self.assertRaises(RuntimeError) as ctx, self.assertLogs('chino.io.cache'):
+            LoadCache(self.cache_dir).load(self.filename, _fail)
+        self.assertIsNone(ctx.exception.__context__)
+
+    def test_max_bytes(self):
+        cache = LoadCache(self.cache_dir, max_bytes=0)
+        self.assertEqual(load(self.filename, cache=cache), {'a': [1, 2, 3]})
+        self.assertEqual(len(os.listdir(self.cache_dir)), 0)
+
+    def test_mapped_formats(self):
+        cache = LoadCache(self.cache_dir)
+        arr = np.arange(6, dtype=np.float32)
+        filename = os.path.join(self.folder, 'a.npy')
+        save(filename, arr)
+        self.assertIsInstance(load(filename, cache=cache), np.memmap)
+        filename = os.path.join(self.folder, 'a.npz')
+        save(filename, {'x': arr})
+        self.assertTrue(np.array_equal(load(filename, cache=cache)['x'], arr))
+        filename = os.path.join(self.folder, 'a.pkl')
+        save(filename, {'x': arr}, out_of_band=True)
+        self.assertFalse(load(filename, cache=cache)['x'].flags.writeable)
+        # zero-parse formats bypass the cache
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+        self.assertFalse(os.listdir(self.cache_dir))
+        # results which cannot be pickled are returned uncached
+        with self.assertLogs('chino.io.cache', level='WARNING'):
+            data = cache.load(self.filename, lambda filename: lambda: filename)
+        self.assertEqual(data(), self.filename)
+        self.assertFalse(os.listdir(self.cache_dir))
+
+
+class TestSave(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        obj = {'a': [1, 2], 'b': 'text'}
+        for ext in ('.json', '.pkl'):
+            filename = os.path.join(self.folder, 'sub', 'obj' + ext)
+            save(filename, obj, create_dir=True)
+            self.assertEqual(load(filename), obj)
+        filename = os.path.join(self.folder, 'a.list')
+        save(filename, ['x', 'y'])
+        self.assertListEqual(load(filename), ['x', 'y'])
+        filename = os.path.join(self.folder, 'a.tsv')
+        save(filename, [[1, 'x'], [2, 'y']])
+        self.assertListEqual(load(filename, as_plain_text=True), [['1', 'x'], ['2', 'y']])
+        # no temporary files are left
+        self.assertListEqual(sorted(os.listdir(os.path.join(self.folder, 'sub'))),
+                             ['obj.json', 'obj.pkl'])
+        with self.assertRaises(ValueError):
+            save(os.path.join(self.folder, 'a.unknown'), obj)
+
+    def test_arrays(self):
+        arr = np.arange(12, dtype=np.float32).reshape(3, 4)
+        filename = os.path.join(self.folder, 'a.npy')
+        save(filename, arr)
+        loaded = load(filename)
+        self.assertIsInstance(loaded, np.memmap)
+        self.assertTrue(np.array_equal(loaded, arr))
+        filename = os.path.join(self.folder, 'a.npz')
+        save(filename, {'x': arr, 'y': arr[0]}, compressed=True)
+        self.assertTrue(np.array_equal(load(filename)['y'], arr[0]))
+        self.assertTrue(np.array_equal(load_array(filename, 'x'), arr))
+        filename = os.path.join(self.folder, 'b.npz')
+        save(filename, {'x': arr, 'y': np.asfortranarray(arr)})
+        for key in ('x', 'y'):
+            loaded = load_array(filename, key)
+            self.assertIsInstance(loaded, np.memmap)
+            self.assertTrue(np.array_equal(loaded, arr))
+        with self.assertRaises(KeyError):
+            load_array(filename)
+
+    def test_out_of_band_pickle(self):
+        obj = {'x': np.arange(100, dtype=np.int64), 'y': [np.ones((3, 3)), 'z']}
+        filename = os.path.join(self.folder, 'a.pkl')
+        save(filename, obj, out_of_band=True)
+        loaded = load(filename)
+        self.assertTrue(np.array_equal(loaded['x'], obj['x']))
+        self.assertTrue(np.array_equal(loaded['y'][0], obj['y'][0]))
+        self.assertEqual(loaded['y'][1], 'z')
+        self.assertFalse(loaded['x'].flags.writeable)
+        self.assertEqual(loaded['x'].ctypes.data % 64, 0)
+        with open(filename, 'rb') as f:
+            with self.assertRaises(pickle.UnpicklingError):
+                pickle.load(f)
+
+
+class TestLoadMany(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filenames = []
+        for i in range(10):
+            filename = os.path.join(self.folder, '{}.json'.format(i))
+            save(filename, {'i': i})
+            self.filenames.append(filename)
+        self.filenames.insert(3, os.path.join(self.folder, 'missing.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_load_many(self):
+        for executor in ('thread', 'process'):
+            results = list(load_many(self.filenames, executor=executor, workers=2))
+            self.assertListEqual([r.filename for r in results], self.filenames)
+            self.assertIsInstance(results[3].error, FileNotFoundError)
+            self.assertListEqual([r.data['i'] for r in results if r.error is None],
+                                 list(range(10)))
+        results = list(load_many(iter(self.filenames), workers=2, ordered=False))
+        self.assertListEqual(sorted(r.filename for r in results), sorted(self.filenames))
+
+
+if __name__ == "__main__":
+    unittest.main()
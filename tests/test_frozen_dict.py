@@ -1,5 +1,8 @@
+import copy
+import pickle
 import unittest
-from chino.frozen_dict import FrozenDict
+import numpy as np
+from chino.frozen_dict import FrozenDict, from_plain_dict, to_plain_dict
 
 
 class TestFrozenDict(unittest.TestCase):
@@ -28,6 +31,164 @@ class TestFrozenDict(unittest.TestCase):
         with self.assertRaises(KeyError):
             fd.SVM = 'Not SVM Options at all'
 
+    def test_dict_api(self):
+        fd = FrozenDict({'A': {'B': 1}, 'L': [{'C': 2}]}, NAME='x')
+        self.assertIsInstance(fd.A, FrozenDict)
+        self.assertIsInstance(fd.L[0], FrozenDict)
+        self.assertEqual(fd.L[0].C, 2)
+        _ = fd.MISSING.CHILD  # reading does not create fields
+        self.assertNotIn('MISSING', fd)
+        fd.update({'A': {'D': 3}})
+        self.assertEqual(fd.to_dict(), {'A': {'B': 1, 'D': 3}, 'L': [{'C': 2}], 'NAME': 'x'})
+        with self.assertRaises(AttributeError):
+            fd.freeze = 1
+        fd.freeze()
+        for other in (pickle.loads(pickle.dumps(fd)), copy.deepcopy(fd)):
+            self.assertEqual(other, fd)
+            self.assertTrue(other.is_frozen())
+            self.assertTrue(other.A.is_frozen())
+            self.assertIsNot(other.A, fd.A)
+        self.assertIs(copy.copy(fd).A, fd.A)
+        self.assertFalse(hasattr(fd, 'MISSING'))
+
+    def test_derive(self):
+        fd = FrozenDict()
+        fd.SOLVER.LR = 0.01
+        fd.SOLVER.STEPS = [10, 20]
+        fd.MODEL.MEAN = np.zeros(3)
+        fd.MODEL.HEAD.DIM = 128
+        fd.DATA.NAMES = ['a']
+        fd.NAME = 'base'
+        fd.freeze()
+        variant = fd.derive({'SOLVER.LR': '0.1', 'MODEL': {'HEAD.DIM': 256}})
+        self.assertTrue(variant.is_frozen())
+        self.assertEqual(variant.SOLVER.LR, 0.1)
+        self.assertEqual(variant.MODEL.HEAD.DIM, 256)
+        self.assertEqual(fd.SOLVER.LR, 0.01)
+        self.assertEqual(fd.MODEL.HEAD.DIM, 128)
+        # unchanged values are shared
+        self.assertIs(variant.SOLVER.STEPS, fd.SOLVER.STEPS)
+        self.assertIs(variant.MODEL.MEAN, fd.MODEL.MEAN)
+        variant2 = variant.derive({'NAME': 'variant2'})
+        self.assertEqual(variant2.NAME, 'variant2')
+        self.assertEqual(variant2.SOLVER.LR, 0.1)
+        # modifying the base copies the subtree for variants sharing it
+        digest = variant.content_hash()
+        self.assertEqual(variant.get_path('DATA.NAMES'), ['a'])
+        fd.DATA.NAMES = ['b']
+        self.assertEqual(fd.DATA.NAMES, ['b'])
+        for v in (variant, variant2):
+            self.assertEqual(v.DATA.NAMES, ['a'])
+            self.assertTrue(v.DATA.is_frozen())
+        self.assertEqual(variant.content_hash(), digest)
+        self.assertEqual(variant.get_path('DATA.NAMES'), ['a'])
+        # assignments through variants stay in the variant
+        variant.SOLVER.LR = 0.5
+        variant.DATA.NAMES = ['c']
+        variant2.MODEL.HEAD.DIM = 512
+        variant2.set_path('DATA.NAMES', ['d'])
+        self.assertEqual((variant.SOLVER.LR, variant2.SOLVER.LR, fd.SOLVER.LR),
+                         (0.5, 0.1, 0.01))
+        self.assertEqual((variant.DATA.NAMES, variant2.DATA.NAMES, fd.DATA.NAMES),
+                         (['c'], ['d'], ['b']))
+        self.assertEqual((variant.MODEL.HEAD.DIM, variant2.MODEL.HEAD.DIM,
+                          fd.MODEL.HEAD.DIM), (256, 512, 128))
+        self.assertNotEqual(variant.content_hash(), digest)
+        # unfreezing the base leaves variants frozen, and vice versa
+        fd.freeze(False)
+        variant3 = fd.derive({'NAME': 'variant3'})
+        variant3['MODEL']['HEAD'].DIM = 64
+        self.assertEqual(fd.MODEL.HEAD.DIM, 128)
+        self.assertFalse(variant3.MODEL.is_frozen())
+        fd.freeze()
+        variant3.freeze(False)
+        self.assertTrue(fd.MODEL.is_frozen())
+        with self.assertRaises(AttributeError):
+            fd.MODEL.TAIL.DIM = 1
+        self.assertTrue(variant2.SOLVER.is_frozen())
+        with self.assertRaises(KeyError):
+            fd.derive({'SOLVER.MOMENTUM': 0.9})
+        with self.assertRaises(KeyError):
+            fd.derive({'SOLVER': 0.9})
+        with self.assertRaises(ValueError):
+            fd.derive({'MODEL.HEAD.DIM': 'large'})
+
+    def test_content_hash(self):
+        def _build(order):
+            fd = FrozenDict()
+            for k in order:
+                fd.A[k] = np.arange(3) if k == 'X' else (1, 2)
+            fd.B = [1, 2]
+            fd.freeze()
+            return fd
+        fd = _build(['X', 'Y'])
+        digest = fd.content_hash()
+        self.assertEqual(digest, _build(['Y', 'X']).content_hash())
+        self.assertEqual(fd.A.content_hash(), _build(['Y', 'X']).A.content_hash())
+        # assignment in subtree invalidates cached hash
+        fd.A.X = np.arange(3).astype(np.float64)
+        self.assertNotEqual(fd.content_hash(), digest)
+        fd.A.X = np.arange(3)
+        self.assertEqual(fd.content_hash(), digest)
+        fd.A.Y = [1, 2]  # list and tuple are different
+        self.assertNotEqual(fd.content_hash(), digest)
+        fd.A.Y = (1, 2)
+        fd.B = [1., 2.]
+        self.assertNotEqual(fd.content_hash(), digest)
+        # caches are only invalidated by assigning to the dict or descendants
+        other = FrozenDict(A={'X': 1}, L=[{'C': 1}])
+        object.__setattr__(other, '_hash', (other._stamps[0], 'cached'))
+        fd.A.X = 0
+        other.A.copy().X = 0
+        self.assertEqual(other.content_hash(), 'cached')
+        other.A.X = 0
+        self.assertNotEqual(other.content_hash(), 'cached')
+        digest = other.content_hash()
+        other.L[0].C = 2  # dicts in lists are tracked as well
+        self.assertNotEqual(other.content_hash(), digest)
+        self.assertEqual(copy.copy(other).content_hash(), other.content_hash())
+
+    def test_paths(self):
+        fd = FrozenDict()
+        fd.SOLVER.LR = 0.01
+        fd.MODEL.HEAD.DIM = 128
+        self.assertEqual(fd.get_path('MODEL.HEAD.DIM'), 128)
+        self.assertIs(fd.get_path(['MODEL', 'HEAD']), fd.MODEL.HEAD)
+        self.assertIsNone(fd.get_path('MODEL.TAIL', None))
+        with self.assertRaises(KeyError):
+            fd.get_path('MODEL.TAIL')
+        fd.set_path('MODEL.TAIL.DIM', 64)  # creates intermediate nodes
+        self.assertEqual(fd.get_path('MODEL.TAIL.DIM'), 64)
+        self.assertEqual(fd.flatten(), {'SOLVER.LR': 0.01, 'MODEL.HEAD.DIM': 128,
+                                        'MODEL.TAIL.DIM': 64})
+        fd.freeze()
+        flat = fd.flatten('__')
+        flat['SOLVER__LR'] = 1.  # returns a new dict every time
+        self.assertEqual(fd.flatten('__')['SOLVER__LR'], 0.01)
+        fd.set_path('SOLVER.LR', 0.1)
+        fd.MODEL.HEAD.DIM = 256
+        self.assertEqual(fd.get_path('SOLVER.LR'), 0.1)
+        self.assertEqual(fd.flatten()['MODEL.HEAD.DIM'], 256)
+        with self.assertRaises(KeyError):
+            fd.set_path('SOLVER.MOMENTUM', 0.9)
+        with self.assertRaises(KeyError):
+            fd.set_path('MODEL.HEAD', 1)
+        fd.freeze(False)
+        del fd.MODEL.TAIL
+        self.assertIsNone(fd.get_path('MODEL.TAIL.DIM', None))
+        self.assertNotIn('MODEL.TAIL.DIM', fd.flatten())
+        # adding keys to another config keeps the index
+        index = fd._path_index()
+        FrozenDict().A.B = 1
+        fd.SOLVER.LR = 0.2
+        self.assertIs(fd._path_index(), index)
+        fd.MODEL.HEAD.BIAS = True
+        self.assertIsNot(fd._path_index(), index)
+        self.assertTrue(fd.get_path('MODEL.HEAD.BIAS'))
+        restored = from_plain_dict(to_plain_dict(fd))
+        self.assertEqual(restored, fd)
+        self.assertEqual(restored.get_path('MODEL.HEAD.DIM'), 256)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,129 @@
+"""Test script for chino image loading."""
+import os
+import shutil
+import tempfile
+import unittest
+import cv2
+import numpy as np
+from chino.image import ImageCache, imread, imread_batch, iter_images, _jpeg_size
+
+
+class TestImread(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        self.filenames = []
+        for i in range(5):
+            filename = os.path.join(self.folder, '{}.png'.format(i))
+            cv2.imwrite(filename, rng.randint(0, 256, (32, 48, 3), dtype=np.uint8))
+            self.filenames.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_imread(self):
+        img = imread(self.filenames[0])
+        self.assertEqual(img.shape, (32, 48, 3))
+        self.assertEqual(img.dtype, np.float32)
+        self.assertLessEqual(img.max(), 1.)
+        img = imread(self.filenames[0], gray=True, dsize=(24, 16))
+        self.assertEqual(img.shape, (16, 24))
+
+    def test_imread_out(self):
+        out = np.zeros((32, 48, 3), dtype=np.float64)
+        img = imread(self.filenames[0], dtype=np.float64, out=out)
+        self.assertIs(img, out)
+        self.assertTrue(np.allclose(out, imread(self.filenames[0])))
+        with self.assertRaises(ValueError):
+            imread(self.filenames[0], out=np.zeros((32, 48), dtype=np.float32))
+
+    def test_reduced_decode(self):
+        filename = os.path.join(self.folder, 'large.jpg')
+        image = cv2.resize(cv2.imread(self.filenames[0]), (800, 600))
+        cv2.imwrite(filename, image)
+        self.assertEqual(_jpeg_size(filename), (800, 600))
+        self.assertIsNone(_jpeg_size(self.filenames[0]))
+        fast = imread(filename, dsize=(64, 48), reduced_decode=True)
+        slow = imread(filename, dsize=(64, 48))
+        # full decoding is the default
+        expected = cv2.resize(cv2.imread(filename), (64, 48))[..., ::-1] / 255.
+        self.assertTrue(np.allclose(slow, expected))
+        self.assertEqual(fast.shape, slow.shape)
+        diff = np.abs(fast - slow)
+        self.assertLess(diff.mean(), 0.03)
+        self.assertLess(diff.max(), 0.2)
+
+    def test_imread_batch(self):
+        for gray in (False, True):
+            batch = imread_batch(self.filenames, gray=gray, dsize=(24, 16),
+                                 workers=2)
+            expected = np.stack([imread(f, gray=gray, dsize=(24, 16))
+                                 for f in self.filenames])
+            self.assertEqual(batch.shape, expected.shape)
+            self.assertTrue(np.allclose(batch, expected))
+        out = np.zeros((5, 32, 48, 3), dtype=np.uint8)
+        batch = imread_batch(self.filenames, dtype=np.uint8, scaled=False, out=out)
+        self.assertIs(batch, out)
+        self.assertTrue(np.array_equal(out[2], imread(self.filenames[2], np.uint8, False)))
+
+    def test_imread_batch_shape_mismatch(self):
+        cv2.imwrite(self.filenames[-1], np.zeros((10, 10, 3), dtype=np.uint8))
+        with self.assertRaises(ValueError):
+            imread_batch(self.filenames)
+
+    def test_iter_images(self):
+        batches = list(iter_images(self.filenames, 2, prefetch=1, workers=2))
+        self.assertListEqual([len(b) for b in batches], [2, 2, 1])
+        self.assertTrue(np.allclose(np.concatenate(batches),
+                                    imread_batch(self.filenames)))
+        batches = list(iter_images(self.filenames, 2, drop_last=True, gray=True))
+        self.assertListEqual([b.shape for b in batches], [(2, 32, 48)] * 2)
+        # early exit stops the background thread
+        it = iter_images(self.filenames * 10, 1, prefetch=2)
+        next(it)
+        it.close()
+        with self.assertRaises(AssertionError):
+            list(iter_images(self.filenames + ['non-existent.png'], 2))
+
+    def test_cache(self):
+        cache = ImageCache(max_bytes=2 * 32 * 48 * 3 * 4)
+        img = imread(self.filenames[0], cache=cache)
+        self.assertIs(imread(self.filenames[0], cache=cache), img)
+        self.assertFalse(img.flags.writeable)
+        for f in self.filenames[1:3]:
+            imread(f, cache=cache)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 3, 1))
+        self.assertEqual(len(cache), 2)
+        cache = ImageCache()
+        imread_batch(self.filenames, cache=cache)
+        batch = imread_batch(self.filenames, cache=cache)
+        self.assertTrue(np.allclose(batch[1], imread(self.filenames[1])))
+        self.assertEqual(cache.stats()['hits'], 5)
+        # modified files are not served from cache
+        cv2.imwrite(self.filenames[2], np.zeros((32, 48, 3), dtype=np.uint8))
+        os.utime(self.filenames[2], ns=(0, 0))
+        self.assertEqual(imread(self.filenames[2], cache=cache).max(), 0.)
+
+    def test_disk_cache(self):
+        cache_dir = os.path.join(self.folder, 'cache')
+        img = imread(self.filenames[0], cache=ImageCache(cache_dir=cache_dir))
+        cache = ImageCache(cache_dir=cache_dir)
+        cached = imread(self.filenames[0], cache=cache)
+        self.assertIsInstance(cached, np.memmap)
+        self.assertTrue(np.array_equal(cached, img))
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+        self.assertListEqual([f for f in os.listdir(cache_dir) if f.endswith('.tmp')], [])
+        # failing to write the disk tier does not fail the load
+        shutil.rmtree(cache_dir)
+        cache = ImageCache(cache_dir=cache_dir)
+        shutil.rmtree(cache_dir)
+        with self.assertLogs('chino.image', level='WARNING'):
+            cached = imread(self.filenames[0], cache=cache)
+        self.assertTrue(np.array_equal(cached, img))
+        self.assertEqual(len(cache), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
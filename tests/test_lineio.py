@@ -0,0 +1,68 @@
+"""Test script for chino line IO."""
+import os
+import shutil
+import tempfile
+import unittest
+from chino.io.lineio import LineIndex, iter_lines, read_lines
+
+
+class TestLineIO(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, 'a.list')
+        with open(self.filename, 'w') as f:
+            f.write('first\n  second \n\nfourth\nlast')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_iter_lines(self):
+        lines = read_lines(self.filename)
+        self.assertListEqual(lines, ['first', 'second', '', 'fourth', 'last'])
+        self.assertListEqual(list(iter_lines(self.filename)), lines)
+
+    def test_line_index(self):
+        lines = read_lines(self.filename)
+        with LineIndex(self.filename) as index:
+            self.assertEqual(len(index), len(lines))
+            self.assertEqual(index[1], 'second')
+            self.assertEqual(index[-1], 'last')
+            self.assertListEqual(index[1:4], lines[1:4])
+            self.assertListEqual(list(index), lines)
+            with self.assertRaises(IndexError):
+                _ = index[len(lines)]
+        self.assertTrue(os.path.isfile(self.filename + '.lineidx.npy'))
+        with LineIndex(self.filename) as index:
+            self.assertListEqual(list(index), lines)
+        # stale index is rebuilt
+        with open(self.filename, 'a') as f:
+            f.write('\nappended\n')
+        with LineIndex(self.filename) as index:
+            self.assertListEqual(list(index), read_lines(self.filename))
+
+    def test_unwritable_index(self):
+        index_file = os.path.join(self.folder, 'index')
+        os.mkdir(index_file)  # the index cannot replace a directory
+        with LineIndex(self.filename, index_file=index_file) as index:
+            self.assertListEqual(list(index), read_lines(self.filename))
+        self.assertListEqual(sorted(os.listdir(self.folder)), ['a.list', 'index'])
+
+    def test_compressed(self):
+        import bz2
+        filename = self.filename + '.bz2'
+        with open(self.filename, 'rb') as f, bz2.open(filename, 'wb') as g:
+            g.write(f.read())
+        self.assertListEqual(read_lines(filename), read_lines(self.filename))
+        self.assertListEqual(list(iter_lines(filename)), read_lines(self.filename))
+        with self.assertRaises(ValueError):
+            LineIndex(filename)
+
+    def test_empty(self):
+        open(self.filename, 'w').close()
+        with LineIndex(self.filename) as index:
+            self.assertEqual(len(index), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
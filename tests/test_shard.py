@@ -0,0 +1,70 @@
+"""Test script for chino image shards."""
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+import cv2
+import numpy as np
+from click.testing import CliRunner
+from chino.cli import cli
+from chino.image import imread
+from chino.io.shard import ShardReader, pack_shards
+
+
+class TestShard(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        self.filenames = []
+        for i in range(6):
+            filename = os.path.join(self.folder, '{}.png'.format(i))
+            cv2.imwrite(filename, rng.randint(0, 256, (20 + i, 30, 3), dtype=np.uint8))
+            self.filenames.append(filename)
+        self.prefix = os.path.join(self.folder, 'packed', 'data')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_encoded(self):
+        num_shards = pack_shards(self.filenames, self.prefix, shard_size=3000)
+        self.assertGreater(num_shards, 1)
+        reader = ShardReader(self.prefix)
+        self.assertEqual(len(reader), 6)
+        self.assertListEqual(list(reader.names), self.filenames)
+        for i in (0, 3, 5, -1):
+            with open(self.filenames[i], 'rb') as f:
+                self.assertEqual(reader[i].tobytes(), f.read())
+        reader = pickle.loads(pickle.dumps(reader))
+        image = cv2.imdecode(reader[2], cv2.IMREAD_COLOR)
+        self.assertTrue(np.array_equal(image, cv2.imread(self.filenames[2])))
+
+    def test_decoded(self):
+        pack_shards(self.filenames, self.prefix, decode=True, dsize=(16, 8))
+        reader = ShardReader(self.prefix)
+        self.assertEqual(reader.shape, (8, 16, 3))
+        for i in range(6):
+            self.assertFalse(reader[i].flags.writeable)
+            self.assertTrue(np.array_equal(reader[i], imread(self.filenames[i], dsize=(16, 8))))
+        with self.assertRaises(ValueError):
+            pack_shards(self.filenames, self.prefix, decode=True)
+
+    def test_cli(self):
+        list_file = os.path.join(self.folder, 'files.list')
+        with open(list_file, 'w') as f:
+            f.write('\n'.join(self.filenames) + '\n')
+        result = CliRunner().invoke(cli, ['pack', list_file, self.prefix, '--decode',
+                                          '--dsize', '16', '8', '--gray'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        reader = ShardReader(self.prefix)
+        self.assertEqual(len(reader), 6)
+        self.assertEqual(reader[1].dtype, np.uint8)
+        self.assertEqual(reader[1].shape, (8, 16))
+        result = CliRunner().invoke(cli, ['pack', list_file, self.prefix])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertFalse(ShardReader(self.prefix).decoded)
+
+
+if __name__ == "__main__":
+    unittest.main()
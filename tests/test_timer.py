@@ -0,0 +1,240 @@
+"""Test script for chino timer."""
+import asyncio
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import numpy as np
+from click.testing import CliRunner
+import chino.timer as ct
+from chino.cli import cli
+from chino.timer import LatencyHistogram, Profiler, Timer
+
+
+class TestTimer(unittest.TestCase):
+
+    def test_modes(self):
+        timer = Timer()
+        for _ in range(2):
+            timer.tic()
+            time.sleep(0.01)
+            total = timer.toc('cumulative')
+        self.assertGreaterEqual(total, 0.02)
+        timer.tic()
+        self.assertAlmostEqual(timer.toc('average'), timer.total / 3)
+        with self.assertRaises(KeyError):
+            timer.tic()
+            timer.toc('unknown')
+        self.assertEqual(timer.histogram.count, 3)
+        other = Timer()
+        other.tic()
+        other.toc('cumulative')
+        timer.merge(other)
+        self.assertEqual(timer.count, 4)
+        self.assertEqual(timer.histogram.count, 4)
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentiles(self):
+        samples = np.random.RandomState(0).lognormal(-6, 1.5, 20000)
+        hists = [LatencyHistogram() for _ in range(2)]
+        for i, x in enumerate(samples):
+            hists[i % 2].record(x)
+        hist = pickle.loads(pickle.dumps(hists[0])).merge(hists[1])
+        self.assertEqual(hist.count, len(samples))
+        self.assertAlmostEqual(hist.total, samples.sum())
+        for q in (1, 50, 90, 99, 99.9):
+            self.assertAlmostEqual(hist.percentile(q) / np.percentile(samples, q), 1., delta=0.04)
+        self.assertEqual(hist.percentile(100), samples.max())
+        self.assertEqual(hist.percentile(0), samples.min())
+        summary = hist.summary()
+        self.assertListEqual(sorted(summary), ['count', 'max', 'mean', 'p50', 'p90', 'p99'])
+        self.assertEqual(LatencyHistogram().percentile(50), 0.)
+        # constant memory, also for very long latencies
+        hist.record(1e6)
+        self.assertEqual(len(hist.counts), len(LatencyHistogram().counts))
+        self.assertEqual(hist.percentile(100), 1e6)
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_scopes(self):
+        prof = Profiler()
+
+        @prof.scope('step')
+        def _step():
+            with prof.scope('load'):
+                time.sleep(0.001)
+
+        with prof.scope('train'):
+            for _ in range(3):
+                _step()
+            prof.tic('eval')
+            self.assertGreater(prof.toc('eval'), 0.)
+        _step()
+        stats = prof.stats()
+        self.assertListEqual(sorted(stats), ['step', 'step/load', 'train', 'train/eval',
+                                             'train/step', 'train/step/load'])
+        self.assertEqual(stats['train/step/load']['count'], 3)
+        self.assertEqual(stats['step']['count'], 1)
+        load = stats['train/step/load']
+        self.assertGreaterEqual(load['min'], 0.001)
+        self.assertLessEqual(load['min'], load['mean'])
+        self.assertLessEqual(load['mean'], load['max'])
+        self.assertAlmostEqual(load['mean'] * 3, load['total'])
+        self.assertGreaterEqual(stats['train']['total'], stats['train/step']['total'])
+        lines = prof.report().split('\n')
+        self.assertEqual(len(lines), 7)
+        self.assertTrue(lines[1].startswith('train '))
+        self.assertTrue(lines[2].startswith('  step '))
+        with self.assertRaises(KeyError):
+            prof.toc()
+        prof.tic('a')
+        with self.assertRaises(KeyError):
+            prof.toc('b')
+
+    def test_disabled(self):
+        prof = Profiler(enabled=False)
+
+        @prof.scope('step')
+        def _step():
+            return 1
+
+        with prof.scope('train'):
+            prof.tic('eval')
+            self.assertEqual(prof.toc('eval'), 0.)
+            self.assertEqual(_step(), 1)
+        self.assertDictEqual(prof.stats(), {})
+        prof.enabled = True
+        prof.reset()
+        with prof.scope('train'):
+            pass
+        self.assertListEqual(list(prof.stats()), ['train'])
+
+
+class TestConcurrency(unittest.TestCase):
+
+    def test_threads(self):
+        prof = Profiler()
+        elapsed = []
+
+        def _worker(i):
+            ct.tic('load')
+            with prof.scope('worker'):
+                for _ in range(5):
+                    with prof.scope('load'):
+                        time.sleep(0.002 * i)
+            elapsed.append((i, ct.toc('load')))
+
+        threads = [threading.Thread(target=_worker, args=(i,)) for i in range(1, 4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # each thread measures its own timer
+        for i, e in elapsed:
+            self.assertGreaterEqual(e, 0.01 * i)
+        stats = prof.stats()
+        self.assertListEqual(sorted(stats), ['worker', 'worker/load'])
+        self.assertEqual(stats['worker']['count'], 3)
+        self.assertEqual(stats['worker/load']['count'], 15)
+        self.assertGreaterEqual(stats['worker/load']['min'], 0.002)
+        self.assertGreaterEqual(stats['worker/load']['max'], 0.006)
+        with self.assertRaises(KeyError):
+            ct.toc('load')  # not started in this thread
+        # statistics of exited threads are merged, not kept per thread
+        self.assertListEqual(prof._thread_stats, [])
+        threads = [threading.Thread(target=_worker, args=(0,)) for _ in range(20)]
+        for t in threads:
+            t.start()
+            t.join()
+        self.assertListEqual(prof._thread_stats, [])
+        stats = prof.stats()
+        self.assertEqual(stats['worker']['count'], 23)
+        self.assertEqual(stats['worker/load']['count'], 115)
+        self.assertGreaterEqual(stats['worker/load']['max'], 0.006)
+
+    def test_tasks(self):
+        prof = Profiler()
+
+        async def _task(i):
+            await asyncio.sleep(0.005 * i)
+            ct.tic('request')
+            with prof.scope('request'):
+                await asyncio.sleep(0.01 * i)
+            return ct.toc('request')
+
+        async def _main():
+            with prof.scope('serve'):
+                return await asyncio.gather(*[_task(i) for i in (3, 1, 2)])
+
+        results = asyncio.run(_main())
+        # timers started by other tasks in between do not interfere
+        for i, e in zip((3, 1, 2), results):
+            self.assertGreaterEqual(e, 0.01 * i)
+        stats = prof.stats()
+        self.assertEqual(stats['serve/request']['count'], 3)
+        self.assertGreaterEqual(stats['serve/request']['max'], 0.03)
+        self.assertLess(stats['serve/request']['min'], 0.02)
+        prof.reset()
+        self.assertDictEqual(prof.stats(), {})
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_trace(self):
+        prof = Profiler(trace_size=8)
+
+        def _worker():
+            for _ in range(4):
+                with prof.scope('load'):
+                    with prof.scope('decode'):
+                        time.sleep(0.001)
+
+        thread = threading.Thread(target=_worker, name='loader')
+        thread.start()
+        thread.join()
+        with prof.scope('step'):
+            pass
+        prof.stop_trace()
+        with prof.scope('ignored'):
+            pass
+        filename = os.path.join(self.folder, 'trace.json')
+        prof.dump_trace(filename)
+        with open(filename) as f:
+            events = json.load(f)['traceEvents']
+        names = [e['args']['name'] for e in events if e['ph'] == 'M']
+        self.assertListEqual(sorted(names), ['MainThread', 'loader'])
+        complete = [e for e in events if e['ph'] == 'X']
+        self.assertEqual(len(complete), 8)  # the latest events only
+        self.assertEqual(complete[-1]['name'], 'step')
+        decode = [e for e in complete if e['name'] == 'decode'][-1]
+        self.assertEqual(decode['args']['path'], 'load/decode')
+        self.assertGreaterEqual(decode['dur'], 1000)
+        summary = ct.summarize_trace(events)
+        self.assertListEqual(sorted(item[0] for item in summary), ['decode', 'load', 'step'])
+        self.assertEqual(summary[-1][:2], ('step', 1))
+        # begin/end events as written by other tools
+        pairs = [{'name': 'a', 'ph': 'B', 'ts': 0, 'tid': 1}, {'ph': 'B', 'name': 'b', 'ts': 1, 'tid': 1},
+                 {'ph': 'E', 'ts': 3, 'tid': 1}, {'ph': 'E', 'ts': 10, 'tid': 1}]
+        self.assertListEqual(ct.summarize_trace(pairs), [('a', 1, 10, 10), ('b', 1, 2, 2)])
+        result = CliRunner().invoke(cli, ['trace', 'summarize', filename, '--by-path', '-n', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        lines = result.output.strip().split('\n')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('load'))
+
+
+if __name__ == "__main__":
+    unittest.main()